@@ -16,14 +16,17 @@ from sqlite3 import (sqlite_version, sqlite_version_info, complete_statement,
                      SQLITE_UPDATE, Row)
 
 from .client import (connect, Connection, register_adapter, register_converter,
-                     Cursor, enable_callback_tracebacks)
+                     Cursor, enable_callback_tracebacks, LazyRow, lazy_rows)
+from .utils import DeadlineExceededError, ServerBusyError
 
 
 __all__ = ["version", "version_info", "sqlite_version", "sqlite_version_info",
            "connect", "Connection", "register_adapter", "register_converter",
            "Cursor", "complete_statement", "enable_callback_tracebacks",
+           "LazyRow", "lazy_rows",
            "Warning", "Error", "DatabaseError", "IntegrityError",
-           "ProgrammingError", "PARSE_COLNAMES", "PARSE_DECLTYPES",
+           "ProgrammingError", "ServerBusyError", "DeadlineExceededError",
+           "PARSE_COLNAMES", "PARSE_DECLTYPES",
            "SQLITE_ALTER_TABLE", "SQLITE_ANALYZE", "SQLITE_ATTACH",
            "SQLITE_CREATE_INDEX", "SQLITE_CREATE_TABLE",
            "SQLITE_CREATE_TEMP_INDEX", "SQLITE_CREATE_TEMP_TABLE",
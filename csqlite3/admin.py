@@ -0,0 +1,78 @@
+"""Administrative requests to the running csqlite3 server."""
+import socket
+
+from . import client
+from . import utils
+
+
+def _admin_request(method, arguments):
+    with client._ConnectionSocket(socket.AF_INET, socket.SOCK_STREAM) \
+            as _socket:
+        _socket.settimeout(5)
+        _socket.connect((utils.HOST, utils.PORT))
+        return _socket.request(client._PID, "admin", method, arguments)
+
+
+def start_profiling(kind, path, duration=None, **options):
+    """Start a *kind* profile of the server that is written to *path*.
+
+    *kind* is one of "cprofile", "sampler", "tracemalloc" or "process", and
+    *path* is a file name on the server side, with --workers each worker
+    writes <path>.<n>. The profile stops after *duration* seconds or when
+    stop_profiling() is called.
+    """
+    arguments = {"kind": kind, "path": path, "duration": duration}
+    arguments.update(options)
+    return _admin_request("start_profiling", arguments)
+
+
+def stop_profiling(kind=None):
+    """Stop the *kind* profile, or all, and return the written paths."""
+    return _admin_request("stop_profiling", {"kind": kind})
+
+
+def cache_stats():
+    """Return hits, misses, evictions, entries and size of the server
+    result cache, and the executed and shared counts of single-flight
+    statements.
+    """
+    return _admin_request("cache_stats", ())
+
+
+def clear_cache():
+    """Drop every entry of the server result cache."""
+    return _admin_request("clear_cache", ())
+
+
+def query_stats(top=None):
+    """Return the calls, total, mean and max time, rows and slow calls of
+    the *top* statements by total time, keyed by normalized SQL.
+    """
+    return _admin_request("query_stats", {"top": top})
+
+
+def reset_query_stats():
+    """Forget the statistics of the statements."""
+    return _admin_request("reset_query_stats", ())
+
+
+def index_advice(top=None, verify=False):
+    """Return the *top* candidate indexes of the sampled statements by
+    estimated benefit, checked on a copy of their database if *verify*.
+    """
+    return _admin_request("index_advice", {"top": top, "verify": verify})
+
+
+def snapshot(name, path=None):
+    """Save the shared in-memory database *name* of the server to *path*,
+    by default its configured snapshot file, and return the path.
+    """
+    return _admin_request("snapshot", {"name": name, "path": path})
+
+
+def drop_memory(name):
+    """Stop keeping the shared in-memory database *name* of the server
+    open, it is freed once its last client closes. Return True if it was
+    kept.
+    """
+    return _admin_request("drop_memory", {"name": name})
@@ -0,0 +1,283 @@
+"""Index advice from the statements run by the server.
+
+A sample of the executed statements is explained in the executor, on a
+side connection of their database, once per normalized statement. Plans
+that scan a whole table, sort with a temporary B-tree or build an
+automatic index give a candidate index: the columns compared with ``=``
+or ``IN`` in the WHERE clause, then the ORDER BY columns, or else one
+range column.
+
+Candidates are ranked by estimated benefit, the sampled executions of
+their statements times the rows of their table, from sqlite_stat1 or
+else counted up to count_limit, and can be checked on one copy of each
+database: a candidate is verified when the plans of its statements stop
+scanning or sorting its table once it exists, then it is dropped again.
+"""
+import asyncio
+import collections
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+
+from . import cache
+from . import slowlog
+
+
+AUTOMATIC = re.compile(r"^SEARCH (\w+) USING AUTOMATIC (?:COVERING )?"
+                       r"INDEX \((.*)\)")
+SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+TEMP_ORDER = "USE TEMP B-TREE FOR ORDER BY"
+TABLES = re.compile(r"\b(?:FROM|JOIN|UPDATE)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?",
+                    re.IGNORECASE)
+WHERE = re.compile(r"\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b"
+                   r"|\bLIMIT\b|$)", re.IGNORECASE | re.DOTALL)
+ORDER = re.compile(r"\bORDER\s+BY\b(.*?)(?:\bLIMIT\b|$)",
+                   re.IGNORECASE | re.DOTALL)
+COMPARISON = re.compile(r"(?:(\w+)\.)?(\w+)\s*(==|=|<=|>=|<|>|\bIS\b|\bIN\b"
+                        r"|\bBETWEEN\b|\bLIKE\b)", re.IGNORECASE)
+COLUMN = re.compile(r"(?:(\w+)\.)?(\w+)")
+KEYWORDS = {"AND", "OR", "NOT", "ASC", "DESC", "COLLATE", "NULLS"}
+EQUALITY = {"=", "==", "IS", "IN"}
+
+
+def aliases(sql):
+    """Return the tables of *sql* by their alias, and by their name."""
+    names = {}
+    for table, alias in TABLES.findall(sql):
+        names[table.lower()] = table
+        if alias and alias.upper() not in {"WHERE", "ON", "JOIN", "SET",
+                                           "ORDER", "GROUP", "LIMIT",
+                                           "INNER", "LEFT", "CROSS"}:
+            names[alias.lower()] = table
+    return names
+
+
+def index_columns(sql, alias, columns, ordered):
+    """Return the columns of an index of the table known as *alias* in
+    *sql*, among its *columns*, with the ORDER BY ones if *ordered*.
+    """
+    equal, ranges, order = [], [], []
+
+    def own(qualifier, column):
+        return (not qualifier or qualifier.lower() == alias) \
+            and column.lower() in columns
+
+    where = WHERE.search(sql)
+    for qualifier, column, operator in COMPARISON.findall(
+            where.group(1) if where else ""):
+        if column.upper() not in KEYWORDS and own(qualifier, column):
+            target = equal if operator.upper() in EQUALITY else ranges
+            target.append(columns[column.lower()])
+    match = ORDER.search(sql)
+    if ordered and match:
+        for term in match.group(1).split(","):
+            column = COLUMN.search(term)
+            if column is None or not own(*column.groups()):
+                order = []
+                break
+            order.append(columns[column.group(2).lower()])
+    result = list(dict.fromkeys(equal))
+    tail = order or ranges[:1]
+    result += [column for column in tail if column not in result]
+    return tuple(result)
+
+
+class Advisor:
+    """Sampled statements of the shared databases and their candidate
+    indexes.
+    """
+    # Rows counted at most in tables that sqlite_stat1 doesn't know.
+    count_limit = 100000
+
+    def __init__(self, sample_rate=0.1, timeout=1):
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.observations = collections.Counter()
+        self.examples = {}
+        self.findings = {}
+        self.connections = {}
+        # advice() and explain() run in other threads than observe().
+        self.lock = threading.Lock()
+        self.connections_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return an instance if [advisor] enables it, else None."""
+        if not config.has_section("advisor"):
+            return None
+        section = config["advisor"]
+        if not section.getboolean("enabled", False):
+            return None
+        return cls(section.getfloat("sample_rate", 0.1))
+
+    def connection(self, database):
+        if database not in self.connections:
+            self.connections[database] = sqlite3.connect(
+                database, timeout=self.timeout, check_same_thread=False,
+                uri=database.startswith("file:"))
+        return self.connections[database]
+
+    def observe(self, database, sql, parameters=()):
+        """Count a sample of the executions of *sql* on *database*, and
+        return the future of its analysis if the statement is new.
+        """
+        if not isinstance(sql, str) \
+                or not cache.is_shared_database(database) \
+                or random.random() >= self.sample_rate:
+            return None
+        # The sample is dropped rather than waiting for advice().
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            key = database, slowlog.normalize(sql)
+            self.observations[key] += 1
+            if key in self.examples:
+                return None
+            self.examples[key] = sql, parameters
+        finally:
+            self.lock.release()
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(None, self.explain, key)
+
+    def explain(self, key):
+        """Find the indexes missed by the example of *key*."""
+        example = self.examples.get(key)
+        if example is None:
+            return
+        with self.connections_lock:
+            try:
+                findings = self.analyze(self.connection(key[0]), *example)
+            except sqlite3.Error:
+                findings = []
+        with self.lock:
+            if key in self.examples:
+                self.findings[key] = findings
+
+    def analyze(self, connection, sql, parameters=()):
+        """Return the (table, columns) of the indexes that the plan of
+        *sql* on *connection* misses.
+        """
+        details = [row[-1] for row in connection.execute(
+            "EXPLAIN QUERY PLAN " + sql, parameters)]
+        names = aliases(sql)
+        scans = []
+        missing = []
+        for detail in details:
+            automatic = AUTOMATIC.match(detail)
+            if automatic:
+                table = names.get(automatic.group(1).lower(),
+                                  automatic.group(1))
+                columns = tuple(re.findall(r"(\w+)[<>=]",
+                                           automatic.group(2)))
+                missing.append((table, columns))
+                continue
+            scan = SCAN.match(detail)
+            if scan and scan.group(1).lower() in names:
+                scans.append(scan.group(1).lower())
+        ordered = TEMP_ORDER in details and len(scans) == 1
+        for alias in scans:
+            table = names[alias]
+            columns = {row[1].lower(): row[1] for row in connection.execute(
+                "SELECT * FROM pragma_table_info(?)", (table,))}
+            found = index_columns(sql, alias, columns, ordered)
+            if found:
+                missing.append((table, found))
+        return missing
+
+    def rows(self, database, table):
+        """Return the estimated rows of *table*."""
+        connection = self.connection(database)
+        try:
+            stat = connection.execute(
+                "SELECT stat FROM sqlite_stat1 WHERE tbl=?",
+                (table,)).fetchone()
+        except sqlite3.OperationalError:
+            stat = None
+        if stat:
+            return int(stat[0].split()[0])
+        return connection.execute(
+            'SELECT count(*) FROM (SELECT 1 FROM "%s" LIMIT ?)'
+            % table.replace('"', '""'), (self.count_limit,)).fetchone()[0]
+
+    def advice(self, top=None, verify=False):
+        """Return the candidate indexes by estimated benefit, verified
+        on a copy of their database if *verify*.
+        """
+        with self.lock, self.connections_lock:
+            return self.candidates(top, verify)
+
+    def candidates(self, top, verify):
+        statements = collections.defaultdict(list)
+        for key, missing in self.findings.items():
+            for table, columns in missing:
+                statements[key[0], table, columns].append(key)
+        candidates = []
+        for (database, table, columns), keys in statements.items():
+            executions = sum(self.observations[key] for key in keys)
+            name = "_".join(["idx", table, *columns])
+            candidates.append({
+                "database": database,
+                "table": table,
+                "sql": "CREATE INDEX %s ON %s (%s)" % (
+                    name, table, ", ".join(columns)),
+                "benefit": executions * self.rows(database, table),
+                "statements": [key[1] for key in keys],
+            })
+        candidates.sort(key=lambda candidate: candidate["benefit"],
+                        reverse=True)
+        candidates = candidates[:top]
+        if verify:
+            with tempfile.TemporaryDirectory() as directory:
+                copies = {}
+                try:
+                    for candidate in candidates:
+                        database = candidate["database"]
+                        if database not in copies:
+                            copies[database] = self.copy(
+                                database, os.path.join(
+                                    directory, "%d.db" % len(copies)))
+                        candidate["verified"] = self.verify(
+                            candidate, copies[database])
+                finally:
+                    for copy in copies.values():
+                        copy.close()
+        return candidates
+
+    def copy(self, database, path):
+        """Return a connection to a copy of *database* made at *path*."""
+        copy = sqlite3.connect(path)
+        self.connection(database).backup(copy)
+        return copy
+
+    def verify(self, candidate, copy):
+        """Return True if the plans of the statements of *candidate* miss
+        no index of its table once it exists on *copy*, the copy of its
+        database, and drop it again.
+        """
+        database, table = candidate["database"], candidate["table"]
+        copy.execute(candidate["sql"])
+        try:
+            for normalized in candidate["statements"]:
+                sql, parameters = self.examples[database, normalized]
+                missing = self.analyze(copy, sql, parameters)
+                if any(found == table for found, _ in missing):
+                    return False
+            return True
+        finally:
+            # CREATE INDEX <name> ON ..., made by candidates().
+            copy.execute("DROP INDEX %s" % candidate["sql"].split()[2])
+
+    def reset(self):
+        with self.lock:
+            self.observations.clear()
+            self.examples.clear()
+            self.findings.clear()
+
+    def close(self):
+        with self.connections_lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
@@ -0,0 +1,240 @@
+"""Bulk import and export of CSV, NDJSON and binary data on the server
+side.
+"""
+import base64
+import csv
+import io
+import itertools
+import json
+import pickle
+import sqlite3
+import struct
+import time
+
+
+# Applied for the length of a bulk load and reverted afterwards.
+BULK_PRAGMAS = {"synchronous": "OFF", "cache_size": -262144}
+
+
+def quote(identifier):
+    return '"%s"' % identifier.replace('"', '""')
+
+
+class ChunkReader(io.RawIOBase):
+    """Binary file object over an iterable of bytes chunks."""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.pending:
+            self.pending = next(self.chunks, None)
+            if self.pending is None:
+                self.pending = b""
+                return 0
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def text_stream(chunks, encoding="utf-8"):
+    """Text file object over an iterable of bytes chunks."""
+    return io.TextIOWrapper(io.BufferedReader(ChunkReader(chunks)),
+                            encoding=encoding, newline="")
+
+
+def read_csv(stream, columns=None, header=True):
+    """Return the column names and an iterator of rows of a CSV stream."""
+    rows = csv.reader(stream)
+    if header:
+        names = next(rows, None)
+        columns = columns or names
+    return columns, rows
+
+
+def read_ndjson(stream, columns=None, header=True):
+    """Return the column names and an iterator of rows of a NDJSON stream.
+
+    Lines can be JSON arrays or objects, the keys of the first object are
+    the column names unless *columns* is given.
+    """
+    lines = (json.loads(line) for line in stream if line.strip())
+    first = next(lines, None)
+    if first is None:
+        return columns, iter(())
+    if isinstance(first, dict):
+        columns = columns or list(first)
+        rows = ([item.get(column) for column in columns]
+                for item in itertools.chain([first], lines))
+    else:
+        rows = itertools.chain([first], lines)
+    return columns, rows
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+class Progress:
+    """Rows loaded or exported so far, updated by the worker thread."""
+    def __init__(self):
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def count(self, rows):
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def count_pages(self, pages):
+        for page in pages:
+            self.rows += len(page)
+            yield page
+
+    def report(self):
+        seconds = time.perf_counter() - self.start
+        rate = self.rows / seconds if seconds else 0.0
+        return {"rows": self.rows, "seconds": seconds,
+                "rows_per_second": rate}
+
+
+def set_pragmas(connection, pragmas):
+    """Set *pragmas* and return their previous values."""
+    previous = {}
+    for name, value in pragmas.items():
+        # Some PRAGMAs have no value for some databases, e.g. mmap_size
+        # of :memory:.
+        row = connection.execute("PRAGMA %s" % name).fetchone()
+        if row is not None:
+            previous[name] = row[0]
+        connection.execute("PRAGMA %s=%s" % (name, value))
+    return previous
+
+
+def drop_indexes(connection, table):
+    """Drop the indexes of *table* and return the SQL to create them."""
+    indexes = connection.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type='index' AND tbl_name=? AND sql IS NOT NULL",
+        (table,)).fetchall()
+    for name, _ in indexes:
+        connection.execute("DROP INDEX %s" % quote(name))
+    return [sql for _, sql in indexes]
+
+
+def load(connection, table, stream, format="csv", columns=None,
+         header=True, pragmas=True, defer_indexes=False, progress=None):
+    """Insert the rows of *stream* into *table* in one transaction.
+
+    Indexes of the table are dropped and built again after the insert when
+    *defer_indexes* is true, so each one is built once instead of being
+    updated row by row.
+    """
+    if format not in READERS:
+        raise sqlite3.ProgrammingError("Unknown bulk format: %r" % format)
+    if connection.in_transaction:
+        raise sqlite3.ProgrammingError(
+            "bulk_load() can't run inside a transaction.")
+    progress = progress or Progress()
+    columns, rows = READERS[format](stream, columns, header)
+    rows = progress.count(rows)
+    first = next(rows, None)
+    if first is None:
+        return progress.report()
+    if columns:
+        names = "(%s)" % ", ".join(quote(column) for column in columns)
+        width = len(columns)
+    else:
+        names = ""
+        width = len(first)
+    sql = "INSERT INTO %s %s VALUES (%s)" % (quote(table), names,
+                                             ", ".join("?" * width))
+    previous = set_pragmas(connection, BULK_PRAGMAS if pragmas else {})
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            indexes = drop_indexes(connection, table) if defer_indexes \
+                else []
+            connection.executemany(sql, itertools.chain([first], rows))
+            for index in indexes:
+                connection.execute(index)
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+    finally:
+        set_pragmas(connection, previous)
+    return progress.report()
+
+
+def fetch_pages(cursor, size=1000):
+    """Iterate over the rows of *cursor* in lists of *size* rows."""
+    while True:
+        page = cursor.fetchmany(size)
+        if not page:
+            return
+        yield page
+
+
+def encode_csv(columns, pages, header=True):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def encode_blob(value):
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError("%r is not JSON serializable" % value)
+
+
+def encode_ndjson(columns, pages, header=True):
+    for page in pages:
+        yield "".join(json.dumps(dict(zip(columns, row)), default=encode_blob)
+                      + "\n" for row in page).encode("utf-8")
+
+
+def encode_binary(columns, pages, header=True):
+    """Length prefixed pickles of the column names and of each page."""
+    if header:
+        pages = itertools.chain([columns], pages)
+    for page in pages:
+        data = pickle.dumps(page, pickle.HIGHEST_PROTOCOL)
+        yield struct.pack("!i", len(data)) + data
+
+
+def read_binary(stream):
+    """Yield the column names and the pages written by encode_binary()."""
+    while True:
+        header = stream.read(4)
+        if not header:
+            return
+        yield pickle.loads(stream.read(*struct.unpack("!i", header)))
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson,
+            "binary": encode_binary}
+
+
+def export(cursor, format="csv", header=True, progress=None):
+    """Yield the rows of an executed *cursor* encoded as *format*, in
+    bytes chunks of one page each, so memory stays bounded.
+    """
+    if format not in ENCODERS:
+        raise sqlite3.ProgrammingError("Unknown export format: %r" % format)
+    columns = [column[0] for column in cursor.description or ()]
+    pages = fetch_pages(cursor)
+    if progress is not None:
+        pages = progress.count_pages(pages)
+    return ENCODERS[format](columns, pages, header)
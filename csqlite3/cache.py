@@ -0,0 +1,213 @@
+"""Sharing of query results between connections of the server.
+
+Results are keyed by (database, sql, parameters, connection settings).
+Each database has a watcher connection whose ``PRAGMA data_version``
+changes whenever another connection commits, that moves the database to
+a new generation, so results of older generations are never shared.
+The key doesn't cover TEMP objects, attached databases or PRAGMAs, so
+connections that have any of them don't share their results.
+
+ResultCache keeps results in LRU order under a memory budget and a ttl,
+and SingleFlight runs identical concurrent statements only once.
+"""
+import asyncio
+import collections
+import pickle
+import re
+import sqlite3
+import threading
+import time
+
+
+READ_ONLY = re.compile(r"\s*(SELECT|WITH|VALUES)\b", re.IGNORECASE)
+WRITE = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+NONDETERMINISTIC = re.compile(
+    r"\b(random|randomblob|changes|total_changes|last_insert_rowid"
+    r"|current_date|current_time|current_timestamp)\b"
+    r"|'now'|'localtime'", re.IGNORECASE)
+
+
+def is_deterministic_read(sql):
+    """Return True if *sql* only reads and always gives the same result
+    for the same database content.
+    """
+    return (isinstance(sql, str) and bool(READ_ONLY.match(sql))
+            and not WRITE.search(sql) and not NONDETERMINISTIC.search(sql))
+
+
+def is_shared_database(database):
+    """Return True if *database* is a file that other connections see."""
+    return (isinstance(database, str) and ":memory:" not in database
+            and "mode=memory" not in database and database != "")
+
+
+def freeze(parameters):
+    """Return a hashable version of *parameters* or None."""
+    if isinstance(parameters, dict):
+        parameters = tuple(sorted(parameters.items()))
+    else:
+        parameters = tuple(parameters)
+    try:
+        hash(parameters)
+    except TypeError:
+        return None
+    return parameters
+
+
+class ResultCursor:
+    """Cursor-like view of rows fetched in advance."""
+    def __init__(self, rows, description, lastrowid=None):
+        self.rows = rows
+        self.description = description
+        self.lastrowid = lastrowid
+        self.rowcount = -1
+        self.position = 0
+
+    def fetchone(self):
+        if self.position < len(self.rows):
+            self.position += 1
+            return self.rows[self.position - 1]
+        return None
+
+    def fetchmany(self, size=1):
+        rows = self.rows[self.position:self.position + size]
+        self.position += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.rows[self.position:]
+        self.position = len(self.rows)
+        return rows
+
+    @property
+    def done(self):
+        return self.position >= len(self.rows)
+
+    def close(self):
+        self.rows = []
+
+
+Entry = collections.namedtuple("Entry", ["generation", "expires", "size",
+                                         "rows", "description"])
+
+
+class DataVersions:
+    """Generation counter of each database, based on PRAGMA data_version.
+    """
+    def __init__(self):
+        self.watchers = {}
+        self.versions = {}
+        self.generations = collections.Counter()
+        self.lock = threading.Lock()
+
+    def generation(self, database):
+        """Return the current generation of *database*."""
+        with self.lock:
+            if database not in self.watchers:
+                self.watchers[database] = sqlite3.connect(
+                    database, check_same_thread=False)
+            watcher = self.watchers[database]
+            version = watcher.execute("PRAGMA data_version").fetchone()[0]
+            if self.versions.get(database) != version:
+                self.versions[database] = version
+                self.generations[database] += 1
+            return self.generations[database]
+
+    def close(self):
+        with self.lock:
+            for watcher in self.watchers.values():
+                watcher.close()
+            self.watchers.clear()
+            self.versions.clear()
+
+
+class SingleFlight(dict):
+    """Run identical concurrent calls once and give every caller the
+    same result.
+    """
+    def __init__(self):
+        super().__init__()
+        self.stats = collections.Counter()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return an instance if [singleflight] enables it, else None."""
+        if config.has_section("singleflight") \
+                and config["singleflight"].getboolean("enabled", False):
+            return cls()
+        return None
+
+    async def run(self, key, function, *args):
+        """Run *function* in the default executor unless a call with the
+        same *key* is in flight, in that case wait for its result.
+        """
+        if key in self:
+            self.stats["shared"] += 1
+            return await asyncio.shield(self[key])
+        self.stats["executed"] += 1
+        loop = asyncio.get_event_loop()
+        future = self[key] = loop.run_in_executor(None, function, *args)
+        try:
+            return await asyncio.shield(future)
+        finally:
+            del self[key]
+
+
+class ResultCache:
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return a cache if the [cache] section enables it, else None."""
+        if not config.has_section("cache"):
+            return None
+        section = config["cache"]
+        if not section.getboolean("enabled", False):
+            return None
+        return cls(section.getint("max_bytes", 64 * 1024 * 1024),
+                   section.getfloat("ttl", 60))
+
+    def get(self, key, generation):
+        """Return the entry of *key* if it is still fresh, else None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry.generation != generation \
+                    or entry.expires < time.monotonic():
+                self.discard(key)
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, key, generation, rows, description):
+        size = len(pickle.dumps((rows, description), pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = Entry(generation, time.monotonic() + self.ttl,
+                                      size, rows, description)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.discard(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
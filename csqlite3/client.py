@@ -1,8 +1,12 @@
 import atexit
+import collections.abc
+import contextlib
+import itertools
 import logging
 import os
 import socket
 import threading
+import time
 import warnings
 import pathlib
 
@@ -14,7 +18,27 @@ _PID = os.getpid()
 
 
 class _ConnectionSocket(utils.PickleSocket):
+    # Writes held back by Connection.write_behind, they are sent before
+    # any other request of the connection.
+    pending = ()
+    # The BatchResult of the last sent write that was held back.
+    written = None
+
     def request(self, *message):
+        if self.pending:
+            self.flush()
+        return self.exchange(*message)
+
+    def flush(self, commit=False):
+        """Send the pending writes in one batch."""
+        statements, self.pending = self.pending, []
+        self.written = None
+        results = self.exchange(_PID, "connection", "run_batch",
+                                [statements, False, commit])
+        self.written = results[-1]
+        return results
+
+    def exchange(self, *message):
         self.write(message)
         response = self.read()
         if isinstance(response, utils.ServerError):
@@ -24,53 +48,200 @@ class _ConnectionSocket(utils.PickleSocket):
         return response
 
 
+def _open_socket(address, timeout):
+    _socket = _ConnectionSocket(socket.AF_INET, socket.SOCK_STREAM)
+    _socket.settimeout(timeout)
+    try:
+        _socket.connect(address)
+    except BaseException:
+        _socket.close()
+        raise
+    return _socket
+
+
+class LazyRow:
+    """Light row of a fetched page, indexed by position or column name.
+
+    The rows of a page share one column index and values are only looked
+    up in the received tuple when accessed.
+    """
+    __slots__ = ("_values", "_index")
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key.lower()]
+            except KeyError:
+                raise IndexError("No item with that key") from None
+        return self._values[key]
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, LazyRow):
+            return self._values == other._values
+        return self._values == other
+
+    def __hash__(self):
+        return hash(self._values)
+
+    def __repr__(self):
+        return "LazyRow(%r)" % (self._values,)
+
+    def keys(self):
+        return list(self._index)
+
+
+class LazyRows(collections.abc.Sequence):
+    """Page of LazyRow objects that are made on access."""
+    __slots__ = ("_rows", "_index")
+
+    def __init__(self, rows, index):
+        self._rows = rows
+        self._index = index
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return LazyRows(self._rows[position], self._index)
+        return LazyRow(self._rows[position], self._index)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return "LazyRows(%r)" % (self._rows,)
+
+
+def lazy_rows(cursor, rows):
+    """Page factory that returns *rows* as LazyRow objects."""
+    return LazyRows(rows, cursor._column_index())
+
+
 class Cursor:
     """SQLite database cursor class."""
+    # executemany() sends its parameters in chunks of this many rows.
+    chunksize = 1000
+    connection = None
+    _page_factory = None
+    # True while the last statement is a write held back by write_behind.
+    _held = False
+
     def __init__(self, database, socket, row_factory, text_factory):
         self._socket = socket
         self._request = self._socket.request
         self._row_factory = row_factory
         self._text_factory = text_factory
         self._database = database
+        self._description = self._index = None
         self._request(_PID, "cursor", "open", {})
 
-    def execute(self, sql, parameters=()):
-        """Executes a SQL statement."""
-        self._request(_PID, "cursor", "execute", [sql, parameters])
+    def _reset(self):
+        # A new statement has a new description.
+        self._description = self._index = None
+        self._held = False
+
+    def _column_index(self):
+        """Return the position of each lower case column name."""
+        if self._index is None:
+            self._index = {column[0].lower(): position for position, column
+                           in enumerate(self.description or ())}
+        return self._index
+
+    def _make_rows(self, rows):
+        if self._page_factory is not None:
+            return self._page_factory(self, rows)
+        if self._row_factory is not None:
+            return [self._row_factory(self, row) for row in rows]
+        return rows
+
+    def execute(self, sql, parameters=(), deadline=None):
+        """Executes a SQL statement or a handle made by
+        Connection.prepare(). The server interrupts the statement and
+        raises DeadlineExceededError if it runs for more than *deadline*
+        seconds, fetches included.
+        """
+        self._reset()
+        if self.connection is not None \
+                and self.connection._holds_back(sql):
+            self._socket.pending.append((sql, parameters))
+            self._held = True
+            if len(self._socket.pending) >= self.connection.write_behind:
+                self._socket.flush()
+            return self
+        arguments = [sql, parameters]
+        if deadline is not None:
+            arguments.append(deadline)
+        if isinstance(sql, int):
+            self._request(_PID, "cursor", "execute_prepared", arguments)
+        else:
+            self._request(_PID, "cursor", "execute", arguments)
         return self
 
     def fetchone(self):
         """Fetches one row from the resultset."""
         data = self._request(_PID, "cursor", "fetchone", {})
-        if self._row_factory:
-            data = self._row_factory(self, data)
+        if data is not None:
+            data = self._make_rows([data])[0]
         return data
 
     def fetchall(self):
         """Fetches all rows from the resultset."""
         data = self._request(_PID, "cursor", "fetchall", ())
-        if self._row_factory:
-            if isinstance(data, list):
-                for i, row in enumerate(data):
-                    data[i] = self._row_factory(self, row)
+        if isinstance(data, utils.Partial):
+            # The server sends a spilled result in slices.
+            rows = list(data)
+            while isinstance(data, utils.Partial):
+                data = self._request(_PID, "cursor", "fetchall", ())
+                rows.extend(data)
+            data = rows
+        if isinstance(data, list):
+            data = self._make_rows(data)
         return data
 
     def fetchmany(self, size=None):
-      """Repeatedly executes a SQL statement."""
-      if size is None:
-          size = self.arraysize
-      return self._request(_PID, "cursor", "fetchmany", [size])
+        """Fetches the next *size* rows of the resultset."""
+        if size is None:
+            size = self.arraysize
+        data = self._request(_PID, "cursor", "fetchmany", [size])
+        if isinstance(data, list):
+            data = self._make_rows(data)
+        return data
 
     def close(self):
         """Closes the cursor."""
         return self._request(_PID, "cursor", "close", {})
 
+    def _written(self):
+        """Return the BatchResult of the held back statement, or None."""
+        if not self._held:
+            return None
+        if self._socket.pending:
+            self._socket.flush()
+        return self._socket.written
+
     @property
     def rowcount(self):
+        written = self._written()
+        if written is not None:
+            return written.rowcount
         return self._request(_PID, "cursor", "_get_attribute", ["rowcount"])
 
     @property
     def lastrowid(self):
+        written = self._written()
+        if written is not None:
+            return written.lastrowid
         return self._request(_PID, "cursor", "_get_attribute", ["lastrowid"])
 
     @property
@@ -88,34 +259,100 @@ class Cursor:
 
     def executemany(self, sql, seq_of_parameters):
         """Repeatedly executes a SQL statement."""
-        self._request(_PID, "cursor", "executemany", [sql, seq_of_parameters])
+        self._reset()
+        iterator = iter(seq_of_parameters)
+        chunk = list(itertools.islice(iterator, self.chunksize))
+        if len(chunk) < self.chunksize:
+            if isinstance(sql, int):
+                self._request(_PID, "cursor", "executemany_prepared",
+                              [sql, chunk])
+            else:
+                self._request(_PID, "cursor", "executemany", [sql, chunk])
+            return self
+        # Stream big or endless parameter sequences in bounded chunks,
+        # the server runs all of them in one atomic executemany.
+        self._request(_PID, "cursor", "executemany_begin", [sql])
+        try:
+            while chunk:
+                self._request(_PID, "cursor", "executemany_chunk", [chunk])
+                chunk = list(itertools.islice(iterator, self.chunksize))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                self._request(_PID, "cursor", "executemany_abort", ())
+            raise
+        self._request(_PID, "cursor", "executemany_end", ())
         return self
 
     def executescript(self, sql_script):
         """Executes a multiple SQL statements at once."""
+        self._reset()
         self._request(_PID, "cursor", "executescript", [sql_script])
         return self
 
     @property
     def description(self):
-        return self._request(_PID, "cursor", "_get_attribute", ["description"])
+        if self._description is None:
+            self._description = self._request(_PID, "cursor",
+                                              "_get_attribute",
+                                              ["description"])
+        return self._description
+
+    def export(self, sql, dest, format="csv", parameters=(), header=True,
+               compress=True):
+        """Writes the result of *sql* to *dest* as "csv", "ndjson" or
+        "binary" and returns the number of rows. Non-standard.
+
+        *dest* is either a path where the server writes the file, or a
+        binary file object the result is streamed to one page at a time,
+        zlib compressed on the wire unless *compress* is false.
+        """
+        self._reset()
+        options = {"sql": sql, "parameters": parameters, "format": format,
+                   "header": header, "compress": compress}
+        if isinstance(dest, (str, os.PathLike)):
+            options["path"] = os.fspath(dest)
+            return self._request(_PID, "cursor", "export", options)
+        self._request(_PID, "cursor", "export", options)
+        import zlib
+        decompressor = zlib.decompressobj() if compress else None
+        while True:
+            rows, chunk = self._request(_PID, "cursor", "export_next", ())
+            if chunk is None:
+                return rows
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            dest.write(chunk)
 
 
 class Connection:
     """connect(database[, timeout, detect_types, isolation_level,
-               check_same_thread, cached_statements, uri])
+               check_same_thread, cached_statements, uri, address,
+               priority, compression, profile])
 
     Opens a connection to the SQLite database file *database*. You can use
     ":memory:" to open a database connection to a database that resides in
     RAM instead of on disk."""
+    # bulk_load() streams file objects in chunks of this many bytes.
+    chunksize = 1024 * 1024
+    # iterdump() receives this many lines per request.
+    dumpsize = 1000
+    # Writes inside implicit transactions are held back on the client and
+    # sent in one batch at commit(), at the next other request, when
+    # lastrowid or rowcount is read or when this many are waiting. 0
+    # disables it. Non-standard.
+    write_behind = 0
+    # With compression, messages of at least this many bytes are
+    # compressed. Non-standard.
+    compression_threshold = 1024
+    _page_factory = None
 
     def __init__(self, database, timeout=5, detect_types=False,
                  isolation_level="", check_same_thread=True,
-                 cached_statements=100, uri=False):
+                 cached_statements=100, uri=False, address=None,
+                 priority=None, compression=None, profile=None):
         self.isolation_level = isolation_level
-        self._socket = _ConnectionSocket(socket.AF_INET, socket.SOCK_STREAM)
-        self._socket.settimeout(timeout)
-        self._socket.connect((utils.HOST, utils.PORT))
+        self.address = address or (utils.HOST, utils.PORT)
+        self._socket = _open_socket(self.address, timeout)
         self._cursor = None
         self._progress = None
         self._trace = None
@@ -132,8 +369,26 @@ class Connection:
                   "check_same_thread": False,
                   "cached_statements": cached_statements,
                   "uri": uri}
+        if priority is not None:
+            kwargs["priority"] = priority
+        if profile is not None:
+            kwargs["profile"] = profile
+        if compression is not None:
+            kwargs["compression"] = {"name": compression,
+                                     "threshold": self.compression_threshold}
         self._request = self._socket.request
-        self._request(_PID, "connection", "open", kwargs)
+        response = self._request(_PID, "connection", "open", kwargs)
+        if isinstance(response, utils.Redirect):
+            # A supervisor answers with the worker of this database.
+            self._socket.close()
+            self.address = response.address
+            self._socket = _open_socket(self.address, timeout)
+            self._request = self._socket.request
+            self._request(_PID, "connection", "open", kwargs)
+        self._socket.pending = []
+        if compression is not None:
+            self._socket.codec = utils.Codec(compression,
+                                             self.compression_threshold)
 
     @property
     def in_transaction(self):
@@ -145,26 +400,91 @@ class Connection:
         if not self._cursor:
             self._cursor = factory(self._database, self._socket,
                                    self._row_factory, self._text_factory)
+            self._cursor.connection = self
+            self._cursor._page_factory = self._page_factory
         return self._cursor
 
+    def _holds_back(self, sql):
+        return bool(self.write_behind) and self.isolation_level is not None \
+            and utils.is_write(sql)
+
     def commit(self):
         """Commit the current transaction."""
+        if self._socket.pending:
+            self._socket.flush(commit=True)
+            return None
         return self._request(_PID, "connection", "commit", ())
 
     def rollback(self):
         """Roll back the current transaction."""
+        self._socket.pending = []
+        self._socket.written = None
         return self._request(_PID, "connection", "rollback", ())
 
     def close(self):
         """Closes the connection."""
+        self._socket.pending = []
         self._request(_PID, "connection", "close", {})
         self._socket.close()
         if self._progress:
             self._progress.shutdown()
 
-    def execute(self, sql, parameters=()):
+    def prepare(self, sql):
+        """Compiles a SQL statement on the server and returns a handle
+        that can be passed to execute() instead of the SQL text for the
+        life of the connection. Non-standard.
+        """
+        return self._request(_PID, "connection", "prepare", [sql])
+
+    def run_batch(self, statements, fetch=False):
+        """Runs pairs of SQL, or prepared handle, and parameters as one
+        transaction in a single request and returns the rowcount,
+        lastrowid and rows of each. *fetch* is True to fetch the rows of
+        every statement or the indexes of the ones to fetch. If one fails
+        the batch is rolled back and the error has the statement_index
+        and statement attributes. Non-standard.
+        """
+        if fetch is not True:
+            fetch = list(fetch or ())
+        statements = [(sql, parameters) for sql, parameters in statements]
+        return self._request(_PID, "connection", "run_batch",
+                             [statements, fetch])
+
+    def bulk_load(self, table, source, format="csv", columns=None,
+                  header=True, encoding="utf-8", pragmas=True,
+                  defer_indexes=False, progress=None):
+        """Loads CSV or NDJSON data into *table* in one transaction and
+        returns the rows, seconds and rows_per_second. Non-standard.
+
+        *source* is a path the server can read or a binary file object
+        that is streamed to the server. Synchronous writes are disabled
+        and the page cache is enlarged during the load unless *pragmas* is
+        false, and indexes are built again at the end if *defer_indexes*.
+        For streamed sources, *progress* is called with the same report
+        after each chunk.
+        """
+        options = {"table": table, "format": format, "columns": columns,
+                   "header": header, "encoding": encoding,
+                   "pragmas": pragmas, "defer_indexes": defer_indexes}
+        if isinstance(source, (str, os.PathLike)):
+            options["path"] = os.fspath(source)
+            return self._request(_PID, "connection", "bulk_load", options)
+        self._request(_PID, "connection", "bulk_load_begin", options)
+        try:
+            for data in iter(lambda: source.read(self.chunksize), b""):
+                report = self._request(_PID, "connection",
+                                       "bulk_load_chunk", [data])
+                if progress:
+                    progress(report)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                self._request(_PID, "connection", "bulk_load_abort", ())
+            raise
+        return self._request(_PID, "connection", "bulk_load_end", ())
+
+    def execute(self, sql, parameters=(), deadline=None):
         """Executes a SQL statement. Non-standard."""
-        return self.cursor().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters, deadline)
 
     def executemany(self, sql, seq_of_parameters):
         """Repeatedly executes a SQL statement. Non-standard."""
@@ -209,6 +529,19 @@ class Connection:
         return self._request(_PID, "connection", "set_progress_handler",
                              arguments)
 
+    def set_deadline(self, seconds):
+        """Sets the deadline of the statements that are executed without
+        one, None for no deadline. Non-standard.
+        """
+        return self._request(_PID, "connection", "set_deadline", [seconds])
+
+    def compression_stats(self):
+        """Returns the bytes sent and received before and after
+        compression. Non-standard.
+        """
+        codec = self._socket.codec
+        return dict(codec.stats) if codec is not None else {}
+
     def set_trace_callback(self, trace_callback):
         """Sets a trace callback called for each SQL
         statement (passed as unicode). Non-standard.
@@ -244,6 +577,21 @@ class Connection:
         if self._cursor:
             self._cursor._row_factory = factory
 
+    @property
+    def page_factory(self):
+        """Called with the cursor and each fetched list of rows, it
+        returns the rows to give to the caller instead of applying
+        row_factory to every row. lazy_rows() is a built-in one.
+        Non-standard.
+        """
+        return self._page_factory
+
+    @page_factory.setter
+    def page_factory(self, factory):
+        self._page_factory = factory
+        if self._cursor:
+            self._cursor._page_factory = factory
+
     @property
     def text_factory(self):
         return self._text_factory
@@ -264,27 +612,66 @@ class Connection:
 
         def iter_dump():
             while True:
-                row = self._request(_PID, "connection", "_next_iterdump", ())
-                if row is StopIteration:
+                lines = self._request(_PID, "connection", "_next_iterdump",
+                                      [self.dumpsize])
+                yield from lines
+                if len(lines) < self.dumpsize:
                     break
-                else:
-                    yield row
 
         return iter_dump()
 
+    def backup(self, target, *, pages=-1, progress=None, name="main",
+               sleep=0.250):
+        """Makes a backup of the database into the file *target* of the
+        server. Non-standard.
+
+        The copy is stepped *pages* at a time in a thread of the server,
+        so other clients aren't blocked, and *progress* is called with
+        (status, remaining, total) every *sleep* seconds.
+        """
+        self._request(_PID, "connection", "backup",
+                      {"target": os.fspath(target), "pages": pages,
+                       "name": name, "sleep": sleep})
+        while True:
+            done, status = self._request(_PID, "connection",
+                                         "_backup_status", ())
+            if progress and status:
+                progress(*status)
+            if done:
+                return
+            time.sleep(sleep)
+
 
 def connect(database, timeout=5, detect_types=False, isolation_level="",
             check_same_thread=True, factory=Connection, cached_statements=100,
-            uri=False):
+            uri=False, address=None, priority=None, compression=None,
+            profile=None):
     """connect(database[, timeout, detect_types, isolation_level,
-               check_same_thread, factory, cached_statements, uri])
+               check_same_thread, factory, cached_statements, uri, address,
+               priority, compression, profile])
 
     Opens a connection to the SQLite database file *database*. You can use
     ":memory:" to open a database connection to a database that resides in
-    RAM instead of on disk."""
-
+    RAM instead of on disk, or ":memory:<name>" for the in-memory database
+    *name* of the server, that all its clients share. *address* is the
+    (host, port) of the server, the configured one by default. *priority*
+    is the scheduling class of the requests of the connection:
+    "interactive", "normal" or "batch".
+    *compression* is "zlib" or "lzma" to compress the large messages of
+    the connection. *profile* is the PRAGMA preset that the server applies
+    to the connection: "oltp", "bulk_load", "analytics", "readonly" or one
+    of config.ini."""
+    options = {}
+    if address is not None:
+        options["address"] = address
+    if priority is not None:
+        options["priority"] = priority
+    if compression is not None:
+        options["compression"] = compression
+    if profile is not None:
+        options["profile"] = profile
     return factory(database, timeout, detect_types, isolation_level,
-                   check_same_thread, cached_statements, uri)
+                   check_same_thread, cached_statements, uri, **options)
 
 
 @atexit.register
@@ -0,0 +1,130 @@
+"""Group commit of small autocommit writes.
+
+Single write statements that connections in autocommit mode send to the
+same database within *window* seconds are run by one committer
+connection in one transaction, so they share one commit and one fsync.
+Each statement runs inside its own savepoint, a failing statement is
+rolled back alone and its error is returned only to its client.
+Connections that set PRAGMAs, attach databases or create TEMP objects
+run their writes themselves, the committer connection has none of them.
+"""
+import asyncio
+import collections
+import sqlite3
+
+
+Result = collections.namedtuple("Result", ["rows", "description",
+                                           "lastrowid", "rowcount"])
+
+
+class Group:
+    """Statements waiting for the next commit of one database."""
+    def __init__(self, database, timeout):
+        self.connection = sqlite3.connect(database, timeout=timeout,
+                                          isolation_level=None,
+                                          check_same_thread=False)
+        self.pending = []
+        self.handle = None
+        self.lock = asyncio.Lock()
+
+    def run(self, batch):
+        """Run *batch* in one transaction and return a Result or an error
+        for each statement.
+        """
+        cursor = self.connection.cursor()
+        results = []
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, parameters in batch:
+                cursor.execute("SAVEPOINT csqlite3_group")
+                try:
+                    cursor.execute(sql, parameters)
+                    results.append(Result(cursor.fetchall(),
+                                          cursor.description,
+                                          cursor.lastrowid, cursor.rowcount))
+                except sqlite3.Error as error:
+                    cursor.execute("ROLLBACK TO csqlite3_group")
+                    results.append(error)
+                cursor.execute("RELEASE csqlite3_group")
+            cursor.execute("COMMIT")
+        except BaseException:
+            if self.connection.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        return results
+
+
+class GroupCommit(dict):
+    """Groups of pending writes, by database."""
+    def __init__(self, window=0.002, max_batch=100, timeout=5):
+        super().__init__()
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.stats = collections.Counter()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return an instance if [groupcommit] enables it, else None."""
+        if not config.has_section("groupcommit"):
+            return None
+        section = config["groupcommit"]
+        if not section.getboolean("enabled", False):
+            return None
+        return cls(section.getfloat("window", 0.002),
+                   section.getint("max_batch", 100))
+
+    def __missing__(self, database):
+        group = self[database] = Group(database, self.timeout)
+        return group
+
+    async def execute(self, database, sql, parameters):
+        """Run *sql* in the next commit of *database* and return its
+        Result.
+        """
+        loop = asyncio.get_event_loop()
+        group = self[database]
+        future = loop.create_future()
+        group.pending.append((sql, parameters, future))
+        if len(group.pending) >= self.max_batch:
+            self.schedule(group, 0)
+        elif group.handle is None:
+            self.schedule(group, self.window)
+        return await future
+
+    def schedule(self, group, delay):
+        if group.handle is not None:
+            group.handle.cancel()
+        loop = asyncio.get_event_loop()
+        group.handle = loop.call_later(
+            delay, lambda: loop.create_task(self.flush(group)))
+
+    async def flush(self, group):
+        group.handle = None
+        batch, group.pending = group.pending, []
+        if not batch:
+            return
+        loop = asyncio.get_event_loop()
+        # One transaction of the committer connection at a time.
+        async with group.lock:
+            try:
+                results = await loop.run_in_executor(
+                    None, group.run, [item[:2] for item in batch])
+            except BaseException as error:
+                results = [error] * len(batch)
+        self.stats["commits"] += 1
+        self.stats["statements"] += len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def close(self):
+        for group in self.values():
+            if group.handle is not None:
+                group.handle.cancel()
+            group.connection.close()
+        self.clear()
@@ -0,0 +1,214 @@
+"""Open-loop load generator for a running csqlite3 server.
+
+Each client sends requests following a fixed arrival schedule, and the
+latency of a request is measured from the time it *should* have been sent.
+So a stall in the server is charged to every request that was queued
+behind it instead of being hidden by the client waiting (coordinated
+omission).
+
+    python -m csqlite3.loadgen --clients 8 --rate 400 --duration 30
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import math
+import multiprocessing
+import queue
+import random
+import sys
+import threading
+import time
+
+
+BUCKET_BASE = 1.05
+PERCENTILES = (50, 90, 99, 99.9)
+READ_SQL = "SELECT value FROM loadgen WHERE id=?"
+WRITE_SQL = "INSERT OR REPLACE INTO loadgen (id, value) VALUES (?, ?)"
+
+
+class Histogram(dict):
+    """Log-bucketed latency histogram with ~5% precision.
+
+    Keys are bucket indexes of latencies in microseconds, values are
+    counts, so instances can be pickled between processes and merged.
+    """
+    def record(self, seconds):
+        microseconds = max(seconds * 1e6, 1.0)
+        bucket = int(math.log(microseconds, BUCKET_BASE))
+        self[bucket] = self.get(bucket, 0) + 1
+
+    def merge(self, other):
+        for bucket, count in other.items():
+            self[bucket] = self.get(bucket, 0) + count
+
+    @property
+    def count(self):
+        return sum(self.values())
+
+    def percentile(self, percent):
+        """Upper bound of the bucket holding *percent*, in milliseconds."""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = math.ceil(total * percent / 100)
+        seen = 0
+        for bucket in sorted(self):
+            seen += self[bucket]
+            if seen >= rank:
+                return BUCKET_BASE ** (bucket + 1) / 1e3
+        return BUCKET_BASE ** (max(self) + 1) / 1e3
+
+
+def new_schedule(rate, duration, poisson=False, seed=None):
+    """Yield the offsets, in seconds, at which requests must be sent."""
+    generator = random.Random(seed)
+    offset = 0.0
+    for number in itertools.count(1):
+        if poisson:
+            offset += generator.expovariate(rate)
+        else:
+            offset = number / rate
+        if offset >= duration:
+            return
+        yield offset
+
+
+def prepare_database(args):
+    import csqlite3
+
+    connection = csqlite3.connect(args.database)
+    connection.execute("CREATE TABLE IF NOT EXISTS loadgen "
+                       "(id INTEGER PRIMARY KEY, value)")
+    connection.executemany(WRITE_SQL, [(i, i) for i in range(args.rows)])
+    connection.commit()
+    connection.close()
+
+
+def run_client(index, args, results):
+    """Run one client and put its per-window histograms in *results*."""
+    import csqlite3
+
+    generator = random.Random(index)
+    connection = csqlite3.connect(args.database, isolation_level=None)
+    cursor = connection.cursor()
+    windows = {}
+    schedule = new_schedule(args.rate / args.clients, args.duration,
+                            args.poisson, seed=index)
+    start = time.perf_counter()
+    for offset in schedule:
+        intended = start + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        key = generator.randrange(args.rows)
+        if generator.random() < args.write_ratio:
+            kind = "write"
+            cursor.execute(args.write_sql, (key, generator.random()))
+        else:
+            kind = "read"
+            cursor.execute(args.read_sql, (key,)).fetchall()
+        latency = time.perf_counter() - intended
+        window = int(offset // args.interval)
+        windows.setdefault((window, kind), Histogram()).record(latency)
+    connection.close()
+    results.put(windows)
+
+
+def run_monitor(pid, directory):
+    """Sample the server process with server.new_monitor in a thread."""
+    from csqlite3 import server
+
+    def target():
+        try:
+            asyncio.run(server.new_monitor(directory, pid))
+        except ImportError:
+            print("psutil is required by --monitor.", file=sys.stderr)
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+
+
+def write_report(windows, args, output):
+    writer = csv.writer(output)
+    writer.writerow(["second", "kind", "count", "p50_ms", "p90_ms",
+                     "p99_ms", "p999_ms"])
+    for (window, kind) in sorted(windows):
+        histogram = windows[window, kind]
+        row = [window * args.interval, kind, histogram.count]
+        row.extend("%.3f" % histogram.percentile(p) for p in PERCENTILES)
+        writer.writerow(row)
+
+
+def print_summary(windows):
+    total = {}
+    for (_, kind), histogram in windows.items():
+        total.setdefault(kind, Histogram()).merge(histogram)
+    for kind, histogram in sorted(total.items()):
+        values = ", ".join("p%s=%.3fms" % (p, histogram.percentile(p))
+                           for p in PERCENTILES)
+        print("%s: %d requests, %s" % (kind, histogram.count, values))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m csqlite3.loadgen")
+    parser.add_argument("-d", "--database", default="loadgen.db",
+                        help="Database file used by the clients")
+    parser.add_argument("-c", "--clients", type=int, default=4,
+                        help="Number of concurrent clients")
+    parser.add_argument("-r", "--rate", type=float, default=100,
+                        help="Target requests per second of all clients")
+    parser.add_argument("-t", "--duration", type=float, default=10,
+                        help="Length of the test in seconds")
+    parser.add_argument("-w", "--write-ratio", type=float, default=0.1,
+                        help="Fraction of requests that are writes")
+    parser.add_argument("-n", "--rows", type=int, default=10000,
+                        help="Rows inserted before the test starts")
+    parser.add_argument("-i", "--interval", type=float, default=1,
+                        help="Seconds per histogram window")
+    parser.add_argument("--poisson", action="store_true",
+                        help="Use exponential inter-arrival times")
+    parser.add_argument("--threads", action="store_true",
+                        help="Run the clients in threads, not processes")
+    parser.add_argument("--read-sql", default=READ_SQL)
+    parser.add_argument("--write-sql", default=WRITE_SQL)
+    parser.add_argument("--monitor", type=int, metavar="PID",
+                        help="Sample CPU and RSS of the server process")
+    parser.add_argument("--monitor-directory", default="bench")
+    parser.add_argument("-o", "--output", help="CSV report path")
+    args = parser.parse_args(argv)
+
+    prepare_database(args)
+    if args.monitor:
+        run_monitor(args.monitor, args.monitor_directory)
+    if args.threads:
+        results = queue.Queue()
+        workers = [threading.Thread(target=run_client,
+                                    args=(i, args, results))
+                   for i in range(args.clients)]
+    else:
+        # Spawned children import csqlite3 again, so each one gets its own
+        # client pid and its own sqlite3 instance in the server.
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        workers = [context.Process(target=run_client, args=(i, args, results))
+                   for i in range(args.clients)]
+    for worker in workers:
+        worker.start()
+    windows = {}
+    for _ in workers:
+        for key, histogram in results.get().items():
+            windows.setdefault(key, Histogram()).merge(histogram)
+    for worker in workers:
+        worker.join()
+
+    if args.output:
+        with open(args.output, "w", newline="") as output:
+            write_report(windows, args, output)
+    else:
+        write_report(windows, args, sys.stdout)
+    print_summary(windows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Named in-memory databases shared by the clients of the server.
+
+connect(":memory:<name>") opens the shared-cache database
+``file:<name>?mode=memory&cache=shared`` of the server, so every client
+that uses the same name queries the same data at RAM speed. A keeper
+connection holds each database open while no client is connected, until
+admin.drop_memory(name) closes it: the database is then freed with its
+last client connection.
+
+A [memory:<name>] section of config.ini can warm load the database from
+a file when the server starts, with ``load=<path>``, and save it to a
+file every ``interval`` seconds through the backup API, with
+``snapshot=<path>``. Saving stops when the database is dropped, and
+errors of these files are logged without stopping the server.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+from . import utils
+
+
+PREFIX = ":memory:"
+
+
+def name_of(database):
+    """Return the name of a named in-memory *database*, or None."""
+    if isinstance(database, str) and database.startswith(PREFIX) \
+            and len(database) > len(PREFIX):
+        return database[len(PREFIX):]
+    return None
+
+
+def uri(name):
+    return "file:%s?mode=memory&cache=shared" % urllib.parse.quote(name)
+
+
+class MemoryDatabases(dict):
+    """Keeper connections of the named in-memory databases, by name."""
+    def __init__(self, settings=None):
+        super().__init__()
+        # name: {"load": path, "snapshot": path, "interval": seconds}
+        self.settings = dict(settings or {})
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, config):
+        settings = {}
+        for section in config.sections():
+            if section.startswith("memory:"):
+                options = config[section]
+                settings[section[len("memory:"):]] = {
+                    "load": options.get("load"),
+                    "snapshot": options.get("snapshot"),
+                    "interval": options.getfloat("interval", 60),
+                }
+        return cls(settings)
+
+    def __missing__(self, name):
+        keeper = self[name] = sqlite3.connect(uri(name), uri=True,
+                                              check_same_thread=False)
+        return keeper
+
+    def open(self, name):
+        """Keep the database *name* open and return its URI."""
+        with self.lock:
+            self[name]
+        return uri(name)
+
+    def drop(self, name):
+        """Stop keeping the database *name* open, and return True if it
+        was kept.
+        """
+        with self.lock:
+            keeper = self.pop(name, None)
+        if keeper is None:
+            return False
+        keeper.close()
+        return True
+
+    def load(self, name, path):
+        """Replace the content of the database *name* by *path*."""
+        source = sqlite3.connect(path)
+        try:
+            with self.lock:
+                source.backup(self[name])
+        finally:
+            source.close()
+
+    def snapshot(self, name, path=None):
+        """Save the database *name* to *path*, by default its snapshot
+        file, and return the path.
+        """
+        path = path or self.settings[name]["snapshot"]
+        temporary = path + ".tmp"
+        with self.lock:
+            # A dropped database must not be saved empty over its file.
+            if name not in self:
+                raise sqlite3.ProgrammingError(
+                    "Unknown in-memory database: %r" % name)
+            target = sqlite3.connect(temporary)
+            try:
+                self[name].backup(target)
+            finally:
+                target.close()
+        # Readers of the file never see a half written snapshot.
+        os.replace(temporary, path)
+        return path
+
+    def save(self):
+        """Save the snapshot of every configured database that has one."""
+        for name, settings in self.settings.items():
+            if settings["snapshot"] and name in self:
+                self.guard(self.snapshot, name)
+
+    def warm(self):
+        """Open the configured databases and load their files."""
+        for name, settings in self.settings.items():
+            self.open(name)
+            if settings["load"] and os.path.exists(settings["load"]):
+                self.guard(self.load, name, settings["load"])
+
+    @staticmethod
+    def guard(method, *arguments):
+        """Call *method* and log its error instead of raising it."""
+        try:
+            return method(*arguments)
+        except Exception as error:
+            extra = {"host": "", "port": 0, "pid": "", "obj": "memory",
+                     "method": method.__name__, "arguments": arguments}
+            utils.logger.error(utils.ServerError(error), extra=extra)
+
+    async def run(self):
+        """Warm the configured databases, then save their snapshots
+        periodically.
+        """
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.warm)
+        tasks = [self.save_every(name, settings["interval"])
+                 for name, settings in self.settings.items()
+                 if settings["snapshot"]]
+        await asyncio.gather(*tasks)
+
+    async def save_every(self, name, interval):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            if name not in self:
+                return
+            await loop.run_in_executor(None, self.guard, self.snapshot,
+                                       name)
+
+    def close(self):
+        for keeper in self.values():
+            keeper.close()
+        self.clear()
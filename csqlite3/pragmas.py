@@ -0,0 +1,72 @@
+"""Named PRAGMA presets of the connections of the server.
+
+connect(database, profile="oltp") makes the server apply the PRAGMAs of
+the profile once, when it opens the connection. Connections that don't
+ask for one get the profile of their database in the [profiles] section
+of config.ini, where keys are fnmatch patterns of database paths:
+
+    [profiles]
+    /srv/reports/*.db=analytics
+
+and a [profile:<name>] section adds a profile or changes the PRAGMAs of
+one. The PRAGMAs of transient profiles are reverted at the first
+commit() or rollback() of the connection, or once it wrote outside of a
+transaction, in autocommit mode or with bulk_load(), so a bulk load
+doesn't leave an unsafe connection behind. Writes of connections with a
+profile are never grouped, the committer connection has no profile.
+"""
+import fnmatch
+import sqlite3
+
+from . import bulk
+
+
+PROFILES = {
+    "oltp": {"journal_mode": "WAL", "synchronous": "NORMAL",
+             "cache_size": -16384, "temp_store": "MEMORY",
+             "busy_timeout": 5000},
+    "bulk_load": dict(bulk.BULK_PRAGMAS, temp_store="MEMORY"),
+    "analytics": {"cache_size": -262144, "mmap_size": 268435456,
+                  "temp_store": "MEMORY"},
+    "readonly": {"query_only": 1, "mmap_size": 268435456},
+}
+TRANSIENT = {"bulk_load"}
+
+
+class Profiles(dict):
+    """PRAGMAs by profile name and profile names by database pattern."""
+    def __init__(self, profiles=PROFILES, databases=None):
+        super().__init__({name: dict(pragmas)
+                          for name, pragmas in profiles.items()})
+        self.databases = dict(databases or {})
+
+    @classmethod
+    def from_config(cls, config):
+        profiles = cls()
+        for section in config.sections():
+            if section.startswith("profile:"):
+                name = section[len("profile:"):]
+                profiles.setdefault(name, {}).update(config[section])
+        if config.has_section("profiles"):
+            profiles.databases.update(config["profiles"])
+        return profiles
+
+    def profile(self, name, database):
+        """Return the profile *name*, else the one of *database*, or
+        None.
+        """
+        if name is None and isinstance(database, str):
+            for pattern, profile in self.databases.items():
+                if fnmatch.fnmatch(database.lower(), pattern):
+                    name = profile
+                    break
+        if name is not None and name not in self:
+            raise sqlite3.ProgrammingError("Unknown profile: %r" % name)
+        return name
+
+    def apply(self, connection, name):
+        """Set the PRAGMAs of *name* on *connection* and return the
+        previous values that must be set back, if it is transient.
+        """
+        previous = bulk.set_pragmas(connection, self[name])
+        return previous if name in TRANSIENT else None
@@ -0,0 +1,150 @@
+"""On-demand profiling of the running server.
+
+A profile is started and stopped through the admin RPCs, and its result is
+written to the path given by the caller when it stops. The available kinds
+are:
+
+    cprofile    deterministic profile of the event loop thread (pstats file)
+    sampler     statistical sampler of the event loop thread (folded stacks)
+    tracemalloc top allocation sites (text)
+    process     CPU percent and RSS of the server process (CSV, psutil)
+"""
+import asyncio
+import collections
+import cProfile
+import csv
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class CProfileSession:
+    def __init__(self, path, **options):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+        self.profile.dump_stats(self.path)
+
+
+class SamplerSession:
+    """Sample the stack of the thread that started it every *interval*."""
+    def __init__(self, path, interval=0.005, **options):
+        self.path = path
+        self.interval = interval
+        self.ident = threading.get_ident()
+        self.stacks = collections.Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, code.co_filename,
+                                             frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        with open(self.path, "w") as output:
+            for stack, count in self.stacks.most_common():
+                output.write("%s %d\n" % (stack, count))
+
+
+class TracemallocSession:
+    def __init__(self, path, frames=1, limit=25, **options):
+        self.path = path
+        self.limit = limit
+        self.was_tracing = tracemalloc.is_tracing()
+        if not self.was_tracing:
+            tracemalloc.start(frames)
+
+    def stop(self):
+        snapshot = tracemalloc.take_snapshot()
+        if not self.was_tracing:
+            tracemalloc.stop()
+        statistics = snapshot.statistics("lineno")
+        with open(self.path, "w") as output:
+            total = sum(stat.size for stat in statistics)
+            output.write("Total allocated size: %.1f KiB\n" % (total / 1024))
+            for stat in statistics[:self.limit]:
+                output.write("%s\n" % stat)
+
+
+class ProcessSession:
+    """Write CPU percent and RSS of this process to a CSV file."""
+    def __init__(self, path, interval=0.5, **options):
+        import psutil
+
+        self.path = path
+        self.interval = interval
+        self.process = psutil.Process(os.getpid())
+        self.process.cpu_percent()
+        self.output = open(path, "w", newline="")
+        self.writer = csv.writer(self.output)
+        self.writer.writerow(["time", "cpu_percent", "rss"])
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopping.wait(self.interval):
+            self.writer.writerow([time.time(), self.process.cpu_percent(),
+                                  self.process.memory_info().rss])
+            self.output.flush()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.output.close()
+
+
+SESSIONS = {
+    "cprofile": CProfileSession,
+    "sampler": SamplerSession,
+    "tracemalloc": TracemallocSession,
+    "process": ProcessSession,
+}
+
+
+class Profiler(dict):
+    """Active profiling sessions of the server, by kind."""
+    def start(self, kind, path, duration=None, **options):
+        if kind not in SESSIONS:
+            raise ValueError("Unknown profile kind: %r" % kind)
+        if kind in self:
+            raise RuntimeError("A %s profile is already running." % kind)
+        session = self[kind] = SESSIONS[kind](path, **options)
+        if duration:
+            # cProfile must be disabled from the thread that enabled it,
+            # that is the event loop thread.
+            loop = asyncio.get_event_loop()
+            loop.call_later(duration, self.expire, kind, session)
+
+    def expire(self, kind, session):
+        if self.get(kind) is session:
+            self.stop(kind)
+
+    def stop(self, kind=None):
+        """Stop *kind*, or all sessions, and return the written paths."""
+        kinds = [kind] if kind else list(self)
+        paths = []
+        for name in kinds:
+            if name in self:
+                session = self.pop(name)
+                session.stop()
+                paths.append(session.path)
+        return paths
@@ -0,0 +1,128 @@
+"""Priority scheduling of the requests of each database.
+
+Requests of one database run one at a time. When several are waiting,
+the next one is picked by weighted fair queuing: every client has a
+virtual finish time that grows by 1 / weight of its priority class with
+each request, and the smallest goes first. So interactive clients get
+more turns than batch clients, and clients of the same class share
+equally. Batch requests are also held back while they used more than
+*batch_share* of the recent time of the database and other requests wait.
+
+The server runs the statements of the scheduled requests in the executor
+while they hold their turn, so the requests of the other clients can
+arrive and wait to be picked meanwhile.
+"""
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+import sqlite3
+import time
+
+
+WEIGHTS = {"interactive": 8, "normal": 4, "batch": 1}
+
+
+def check(priority, weights=WEIGHTS):
+    """Raise ProgrammingError if *priority* is not a class of *weights*.
+    """
+    if priority not in weights:
+        raise sqlite3.ProgrammingError(
+            "Unknown priority: %r, use one of %s."
+            % (priority, ", ".join(weights)))
+
+
+class Scheduler:
+    def __init__(self, weights=None, batch_share=0.25, window=100):
+        self.weights = dict(weights or WEIGHTS)
+        self.batch_share = batch_share
+        self.window = window
+        self.queues = collections.defaultdict(list)
+        self.busy = set()
+        self.virtual = collections.Counter()
+        self.finish = {}
+        self.usage = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.window))
+        self.counter = itertools.count()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return a scheduler if [scheduler] enables it, else None."""
+        if not config.has_section("scheduler"):
+            return None
+        section = config["scheduler"]
+        if not section.getboolean("enabled", False):
+            return None
+        weights = {name: section.getfloat(name, weight)
+                   for name, weight in WEIGHTS.items()}
+        return cls(weights, section.getfloat("batch_share", 0.25))
+
+    def tag(self, database, client, priority):
+        """Return the virtual finish time of the next request of *client*.
+        """
+        start = max(self.virtual[database],
+                    self.finish.get((database, client), 0))
+        tag = self.finish[database, client] = \
+            start + 1 / self.weights[priority]
+        return tag
+
+    @contextlib.asynccontextmanager
+    async def turn(self, database, client, priority="normal"):
+        """Wait for the turn of a request of *client* on *database*."""
+        tag = self.tag(database, client, priority)
+        if database in self.busy:
+            future = asyncio.get_event_loop().create_future()
+            heapq.heappush(self.queues[database],
+                           (tag, next(self.counter), priority, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.wake(database)
+                raise
+        else:
+            self.busy.add(database)
+            self.virtual[database] = tag
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.usage[database].append(
+                (priority, time.perf_counter() - start))
+            self.wake(database)
+
+    def batch_exceeded(self, database):
+        usage = self.usage[database]
+        total = sum(elapsed for _, elapsed in usage)
+        batch = sum(elapsed for priority, elapsed in usage
+                    if priority == "batch")
+        return total > 0 and batch / total > self.batch_share
+
+    def pick(self, database):
+        """Remove and return the next waiting request of *database*."""
+        queue = self.queues[database]
+        if queue[0][2] == "batch" and self.batch_exceeded(database):
+            others = [item for item in queue if item[2] != "batch"]
+            if others:
+                item = min(others)
+                queue.remove(item)
+                heapq.heapify(queue)
+                return item
+        return heapq.heappop(queue)
+
+    def wake(self, database):
+        """Give the turn of *database* to the next waiting request."""
+        queue = self.queues[database]
+        while queue:
+            tag, _, _, future = self.pick(database)
+            if not future.done():
+                self.virtual[database] = tag
+                future.set_result(None)
+                return
+        del self.queues[database]
+        self.busy.discard(database)
+
+    def forget(self, database, client):
+        """Drop the state of a client that closed its connection."""
+        self.finish.pop((database, client), None)
@@ -1,18 +1,48 @@
+import argparse
 import asyncio
 import collections
+import contextlib
 import functools
+import inspect
+import itertools
+import os
 import pickle
+import queue
 import socket
 import sqlite3
 import struct
+import threading
+import time
 import traceback
 
 
+from . import advisor
+from . import bulk
+from . import cache
+from . import groupcommit
+from . import memory
+from . import pragmas
+from . import profiling
+from . import scheduling
+from . import slowlog
+from . import spool
 from . import utils
 
 
 logger = utils.SafeLogger("Server")
 active_client_apps = {}
+profiler = profiling.Profiler()
+result_cache = cache.ResultCache.from_config(utils.CONFIG)
+single_flight = cache.SingleFlight.from_config(utils.CONFIG)
+data_versions = cache.DataVersions()
+admission = utils.Admission.from_config(utils.CONFIG)
+scheduler = scheduling.Scheduler.from_config(utils.CONFIG)
+group_commit = groupcommit.GroupCommit.from_config(utils.CONFIG)
+result_buffers = spool.ResultBuffers.from_config(utils.CONFIG)
+slow_log = slowlog.SlowLog.from_config(utils.CONFIG)
+index_advisor = advisor.Advisor.from_config(utils.CONFIG)
+profiles = pragmas.Profiles.from_config(utils.CONFIG)
+memory_databases = memory.MemoryDatabases.from_config(utils.CONFIG)
 
 SQLITE3_EXCEPTIONS = (sqlite3.Warning, sqlite3.DataError,
                       sqlite3.DatabaseError, sqlite3.Error,
@@ -21,6 +51,183 @@ SQLITE3_EXCEPTIONS = (sqlite3.Warning, sqlite3.DataError,
                       sqlite3.OperationalError, sqlite3.ProgrammingError)
 
 
+@contextlib.contextmanager
+def atomic(connection, name="csqlite3"):
+    """Run the block inside a savepoint that is rolled back on errors.
+
+    Like sqlite3 does before a DML statement, a transaction is opened first
+    unless the connection is in autocommit mode, so the caller still has
+    to commit. In autocommit mode, releasing the savepoint commits. On
+    errors, a transaction opened here is rolled back as a whole.
+    """
+    began = connection.isolation_level is not None \
+        and not connection.in_transaction
+    if began:
+        connection.execute("BEGIN " + connection.isolation_level)
+    connection.execute("SAVEPOINT " + name)
+    try:
+        yield
+    except BaseException:
+        # The savepoint is gone if the error rolled back the transaction.
+        with contextlib.suppress(sqlite3.OperationalError):
+            if began:
+                connection.execute("ROLLBACK")
+            else:
+                connection.execute("ROLLBACK TO " + name)
+                connection.execute("RELEASE " + name)
+        raise
+    connection.execute("RELEASE " + name)
+
+
+class ParameterUpload:
+    """Feed chunks of parameters, as they arrive from the client, to one
+    function that runs in its own thread and iterates over this object.
+    """
+    def __init__(self, function, timeout):
+        self.queue = queue.Queue(maxsize=2)
+        self.timeout = timeout
+        loop = asyncio.get_event_loop()
+        self.future = loop.create_future()
+        thread = threading.Thread(target=self.run, args=(function, loop))
+        thread.daemon = True
+        thread.start()
+
+    def __iter__(self):
+        while True:
+            try:
+                chunk = self.queue.get(timeout=self.timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError(
+                    "Timed out waiting for parameters.") from None
+            if chunk is StopIteration:
+                return
+            elif isinstance(chunk, BaseException):
+                raise chunk
+            yield from chunk
+
+    def run(self, function, loop):
+        try:
+            result = function(self)
+        except BaseException as error:
+            loop.call_soon_threadsafe(self.future.set_exception, error)
+        else:
+            loop.call_soon_threadsafe(self.future.set_result, result)
+        finally:
+            # Unblock a put() that is waiting for a dead consumer.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+
+    async def put(self, chunk):
+        if not self.future.done():
+            try:
+                self.queue.put_nowait(chunk)
+            except queue.Full:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.queue.put, chunk)
+        if self.future.done():
+            await self.future
+
+    async def finish(self):
+        await self.put(StopIteration)
+        return await self.future
+
+    async def abort(self, error):
+        with contextlib.suppress(BaseException):
+            await self.put(error)
+            await self.future
+
+
+class Deadline:
+    """Progress handler that interrupts the statements of a connection
+    when they run past their deadline, composed with the progress handler
+    set by the client.
+    """
+    # SQLite virtual machine instructions between two deadline checks.
+    steps = 1000
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.default = None
+        self.expires = None
+        self.expired = False
+        # Only the cursor calls that run the statement are interrupted.
+        self.active = False
+        self.handler = None
+        self.n = 0
+        self.count = 0
+
+    def __call__(self):
+        if self.active and self.expires is not None \
+                and time.monotonic() > self.expires:
+            self.expired = True
+            return 1
+        if self.handler is not None:
+            self.count += self.step
+            if self.count >= self.n:
+                self.count = 0
+                return self.handler()
+        return 0
+
+    @property
+    def step(self):
+        if self.expires is None:
+            return self.n
+        return min(self.n, self.steps) if self.handler else self.steps
+
+    def install(self):
+        if self.handler is None and self.expires is None:
+            self.connection.set_progress_handler(None, 0)
+        else:
+            self.connection.set_progress_handler(self, self.step)
+
+    def set_handler(self, handler, n):
+        self.handler = handler if n > 0 else None
+        self.n = n
+        self.count = 0
+        self.install()
+
+    def start(self, seconds=None):
+        """Give the next statements *seconds*, or the default, to finish.
+        """
+        seconds = self.default if seconds is None else seconds
+        expires = time.monotonic() + seconds if seconds else None
+        if (expires is None) != (self.expires is None):
+            self.expires = expires
+            self.install()
+        self.expires = expires
+        self.expired = False
+
+    @contextlib.contextmanager
+    def translate(self):
+        """Enforce the deadline in the block and raise
+        DeadlineExceededError for statements interrupted by it.
+        """
+        self.active = True
+        try:
+            yield
+        except sqlite3.OperationalError as error:
+            if self.expired:
+                raise utils.DeadlineExceededError(
+                    "Statement deadline exceeded.") from error
+            raise
+        finally:
+            self.active = False
+
+    def wrap(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.translate():
+                result = method(*args, **kwargs)
+            if inspect.isawaitable(result):
+                return self.wait(result)
+            return result
+        return wrapper
+
+    async def wait(self, awaitable):
+        with self.translate():
+            return await awaitable
+
+
 class ModuleDispatcher(dict):
     def __init__(self, module):
         super().__init__({
@@ -30,9 +237,84 @@ class ModuleDispatcher(dict):
         })
 
 
+class AdminDispatcher(dict):
+    def __init__(self):
+        super().__init__({
+            "start_profiling": profiler.start,
+            "stop_profiling": profiler.stop,
+            "cache_stats": self.cache_stats,
+            "clear_cache": self.clear_cache,
+            "query_stats": self.query_stats,
+            "reset_query_stats": self.reset_query_stats,
+            "index_advice": self.index_advice,
+            "snapshot": self.snapshot,
+            "drop_memory": memory_databases.drop,
+        })
+
+    def cache_stats(self):
+        stats = {}
+        if result_cache is not None:
+            stats.update(result_cache.stats, entries=len(result_cache.entries),
+                         size=result_cache.size)
+        if single_flight is not None:
+            stats.update(single_flight.stats)
+        return stats
+
+    def clear_cache(self):
+        if result_cache is not None:
+            result_cache.clear()
+
+    def query_stats(self, top=None):
+        if slow_log is None:
+            return {}
+        return slow_log.report(top)
+
+    def reset_query_stats(self):
+        if slow_log is not None:
+            slow_log.reset()
+
+    def index_advice(self, top=None, verify=False):
+        if index_advisor is None:
+            return []
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(None, index_advisor.advice, top, verify)
+
+    def snapshot(self, name, path=None):
+        if name not in memory_databases:
+            raise sqlite3.ProgrammingError(
+                "Unknown in-memory database: %r" % name)
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(None, memory_databases.snapshot, name,
+                                    path)
+
+
 class ConnectionDispatcher(dict):
     def __init__(self, host, port, pid):
+        self.key = (host, port, pid)
         self.connection = None
+        self.codec = None
+        self.profile = None
+        # Session of the result_buffers budget of the rows that a cursor
+        # fetched in advance, held until they are all fetched.
+        self.held = (host, port, pid, "held")
+        # PRAGMAs to set back at the end of a transient profile, and the
+        # total_changes of the connection when it was applied.
+        self.restore = None
+        self.changes = 0
+        self.priority = "normal"
+        self.statements = {}
+        self.database = None
+        self.detect_types = 0
+        self.timeout = 5
+        self.upload = None
+        self.progress = None
+        # Functions, collations and authorizers make the results of a
+        # connection differ from others, so its results aren't cached.
+        self.customized = False
+        # PRAGMAs, attached databases or TEMP objects that other
+        # connections don't see, so its writes aren't grouped and its
+        # results aren't cached.
+        self.local = False
 
         # sqlite3 module has some global variables, so I need
         # to create one sqlite3 instance per client app
@@ -47,33 +329,246 @@ class ConnectionDispatcher(dict):
 
     def iterdump(self):
         iterable = self.connection.iterdump()
-        def _next_iterdump():
-            try:
-                return next(iterable)
-            except StopIteration:
-                return StopIteration
+        def _next_iterdump(size=1):
+            return list(itertools.islice(iterable, size))
         self["_next_iterdump"] = _next_iterdump
         return None
 
-    def connector(self, **kwargs):
+    def backup(self, target, pages=-1, name="main", sleep=0.250):
+        """Start a backup into the file *target* in the default executor.
+        """
+        status = [None]
+
+        def progress(*arguments):
+            status[0] = arguments
+
+        def backup():
+            destination = sqlite3.connect(target)
+            try:
+                self.connection.backup(destination, pages=pages, name=name,
+                                       progress=progress, sleep=sleep)
+            finally:
+                destination.close()
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(None, backup)
+
+        def _backup_status():
+            """Return if the backup is done and the last progress."""
+            if future.done():
+                future.result()
+            return future.done(), status[0]
+        self["_backup_status"] = _backup_status
+
+    async def bulk_load(self, table, path, encoding="utf-8", **options):
+        def load():
+            with open(path, newline="", encoding=encoding) as stream:
+                return bulk.load(self.connection, table, stream, **options)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, load)
+
+    def bulk_load_begin(self, table, encoding="utf-8", **options):
+        """Start a bulk load whose data comes in later requests."""
+        self.progress = bulk.Progress()
+
+        def load(chunks):
+            stream = bulk.text_stream(chunks, encoding)
+            return bulk.load(self.connection, table, stream,
+                             progress=self.progress, **options)
+        self.upload = ParameterUpload(load, self.timeout)
+
+    async def bulk_load_chunk(self, data):
+        try:
+            await self.upload.put([data])
+        except BaseException:
+            self.upload = None
+            raise
+        return self.progress.report()
+
+    async def bulk_load_end(self):
+        upload, self.upload = self.upload, None
+        return await upload.finish()
+
+    async def bulk_load_abort(self):
+        upload, self.upload = self.upload, None
+        if upload is not None:
+            await upload.abort(sqlite3.OperationalError(
+                "bulk_load was aborted by the client."))
+
+    def prepare(self, sql):
+        # Compile the statement once to report errors at prepare time.
+        try:
+            self.connection.execute("EXPLAIN " + sql)
+        except sqlite3.ProgrammingError as error:
+            if "binding" not in str(error):
+                raise
+        handle = len(self.statements) + 1
+        self.statements[handle] = sql
+        return handle
+
+    def run_batch(self, statements, fetch=False, commit=None):
+        """Run *statements*, pairs of SQL or prepared handle and
+        parameters, as one transaction and return a BatchResult each.
+
+        *fetch* is True to fetch the rows of every statement, or the
+        indexes of the statements to fetch. An error rolls back the whole
+        batch and tells the index and SQL of the failing statement. The
+        transaction is committed if *commit* is true, or if it is None
+        and the batch opened the transaction.
+        """
+        began = not self.connection.in_transaction
+        cursor = self.connection.cursor()
+        results = []
+        with atomic(self.connection, "csqlite3_batch"):
+            for index, (sql, parameters) in enumerate(statements):
+                if isinstance(sql, int):
+                    sql = self.statement(sql)
+                self.track(sql)
+                try:
+                    cursor.execute(sql, parameters)
+                    wanted = fetch is True or (fetch and index in fetch)
+                    rows = cursor.fetchall() if wanted else None
+                except sqlite3.Error as error:
+                    error.statement_index = index
+                    error.statement = sql
+                    raise
+                results.append(utils.BatchResult(cursor.rowcount,
+                                                 cursor.lastrowid, rows))
+        if commit is None:
+            commit = began
+        if commit and self.connection.in_transaction:
+            self.commit()
+        return results
+
+    def statement(self, handle):
+        try:
+            return self.statements[handle]
+        except KeyError:
+            raise sqlite3.ProgrammingError(
+                "Unknown prepared statement: %r" % handle) from None
+
+    def track(self, sql):
+        """Remember if *sql* may change the state of the connection."""
+        if not self.local and utils.is_local(sql):
+            self.local = True
+
+    def customize(self, method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            self.customized = True
+            return method(*args, **kwargs)
+        return wrapper
+
+    def read_key(self, sql, parameters):
+        """Return the key of a read whose result can be shared with other
+        connections, or None.
+        """
+        if (result_cache is None and single_flight is None) \
+                or self.customized or self.local \
+                or self.connection.row_factory is not None \
+                or self.connection.in_transaction \
+                or self.database is None \
+                or not cache.is_deterministic_read(sql):
+            return None
+        parameters = cache.freeze(parameters)
+        if parameters is None:
+            return None
+        return (self.database, sql, parameters, self.detect_types,
+                self.connection.text_factory)
+
+    def can_group(self, sql):
+        """Return True if *sql* can be committed with the writes of other
+        connections.
+        """
+        return (group_commit is not None and not self.customized
+                and not self.local and self.profile is None
+                and self.database is not None
+                and self.connection.isolation_level is None
+                and not self.connection.in_transaction
+                and self.connection.row_factory is None
+                and self.connection.text_factory is str
+                and not self.detect_types
+                and utils.is_write(sql))
+
+    def connector(self, priority="normal", compression=None, profile=None,
+                  **kwargs):
+        scheduling.check(priority, scheduler.weights if scheduler
+                         else scheduling.WEIGHTS)
+        self.priority = priority
+        self.codec = utils.Codec(**compression) if compression else None
+        database = kwargs.get("database")
+        name = memory.name_of(database)
+        if name is not None:
+            kwargs.update(database=memory_databases.open(name), uri=True)
+        if not kwargs.get("uri") and cache.is_shared_database(database):
+            self.database = os.path.abspath(database)
+        self.profile = profiles.profile(profile, self.database or database)
         self.connection = self.sqlite3.connect(**kwargs)
+        self.deadline = Deadline(self.connection)
+        if self.profile is not None:
+            self.restore = profiles.apply(self.connection, self.profile)
+            self.changes = self.connection.total_changes
+        self.detect_types = kwargs.get("detect_types", 0)
+        self.timeout = kwargs.get("timeout", 5)
         self.update({
             "_get_attribute": functools.partial(getattr, self.connection),
             "_set_attribute": functools.partial(setattr, self.connection),
             "set_progress_handler": self.new_progress_handler(),
+            "set_deadline": self.set_deadline,
             "set_trace_callback": self.new_trace_server(),
             "iterdump": self.iterdump,
-            "commit": self.connection.commit,
-            "create_aggregate": self.connection.create_aggregate,
-            "create_collation": self.connection.create_collation,
-            "create_function": self.connection.create_function,
+            "backup": self.backup,
+            "prepare": self.prepare,
+            "run_batch": self.run_batch,
+            "bulk_load": self.bulk_load,
+            "bulk_load_begin": self.bulk_load_begin,
+            "bulk_load_chunk": self.bulk_load_chunk,
+            "bulk_load_end": self.bulk_load_end,
+            "bulk_load_abort": self.bulk_load_abort,
+            "commit": self.commit,
+            "create_aggregate": self.customize(
+                self.connection.create_aggregate),
+            "create_collation": self.customize(
+                self.connection.create_collation),
+            "create_function": self.customize(
+                self.connection.create_function),
             "enable_load_extension": self.connection.enable_load_extension,
             "interrupt": self.connection.interrupt,
-            "close": self.connection.close,
-            "rollback": self.connection.rollback,
-            "set_authorizer": self.connection.set_authorizer,
+            "close": self.close,
+            "rollback": self.rollback,
+            "set_authorizer": self.customize(self.connection.set_authorizer),
         })
 
+    def commit(self):
+        self.connection.commit()
+        self.end_profile()
+
+    def rollback(self):
+        self.connection.rollback()
+        self.end_profile()
+
+    def end_profile(self):
+        """Set back the PRAGMAs of a transient profile."""
+        if self.restore is not None:
+            bulk.set_pragmas(self.connection, self.restore)
+            self.restore = None
+
+    def after_request(self):
+        """End a transient profile once the connection wrote and its
+        transaction is over, in autocommit mode or after bulk_load.
+        """
+        if self.restore is not None \
+                and not self.connection.in_transaction \
+                and self.connection.total_changes > self.changes:
+            self.end_profile()
+
+    def close(self):
+        self.restore = None
+        self.connection.close()
+        if result_buffers is not None:
+            result_buffers.release(self.held)
+        if scheduler is not None:
+            scheduler.forget(self.database or self.key, self.key)
+
     def new_progress_handler(self):
         def handler(address, n):
             def callable():
@@ -81,9 +576,14 @@ class ConnectionDispatcher(dict):
                     sock.connect(address)
                     sock.send(b"0")
                 return 0
-            self.connection.set_progress_handler(callable, n)
+            self.deadline.set_handler(callable, n)
         return handler
 
+    def set_deadline(self, seconds):
+        """Set the default deadline of the statements of the connection.
+        """
+        self.deadline.default = seconds
+
     def new_trace_server(self):
         def handler(address):
             def callable(data):
@@ -98,20 +598,305 @@ class ConnectionDispatcher(dict):
 
 
 class CursorDispatcher:
+    methods = {"execute", "execute_prepared", "executemany",
+               "executemany_prepared", "executemany_begin",
+               "executemany_chunk", "executemany_end", "executemany_abort",
+               "executescript", "export", "export_next", "close"}
+    result_methods = {"fetchone", "fetchmany", "fetchall"}
+
     def __init__(self, connection):
+        self.dispatcher = connection
         self.connection = connection.connection
         self.cursor = None
+        # Rows served from the result cache instead of self.cursor.
+        self.result = None
+        self.upload = None
+        self.exporting = None
+        # Spilled rows of fetchall() that are not sent yet.
+        self.spool = None
+        # The statement being timed for the slow log.
+        self.timing = None
 
     def connector(self, **kwargs):
         self.cursor = self.connection.cursor()
 
+    def statement(self, handle):
+        return self.dispatcher.statement(handle)
+
+    def execute(self, sql, parameters=(), deadline=None):
+        self.clear_result()
+        self.close_spool()
+        self.begin_timing(sql, parameters)
+        self.dispatcher.deadline.start(deadline)
+        self.dispatcher.track(sql)
+        if self.dispatcher.can_group(sql):
+            return self.execute_grouped(sql, parameters)
+        key = self.dispatcher.read_key(sql, parameters)
+        if key is None:
+            return self.cursor.execute(sql, parameters)
+        return self.execute_cached(key, sql, parameters)
+
+    async def execute_grouped(self, sql, parameters):
+        result = await group_commit.execute(self.dispatcher.database, sql,
+                                            parameters)
+        self.result = cache.ResultCursor(result.rows, result.description,
+                                         result.lastrowid)
+        self.result.rowcount = result.rowcount
+
+    async def execute_cached(self, key, sql, parameters):
+        # PRAGMA data_version waits while the database is locked, so it
+        # runs in the executor like the statement.
+        loop = asyncio.get_event_loop()
+        generation = await loop.run_in_executor(
+            None, data_versions.generation, self.dispatcher.database)
+        if result_cache is not None:
+            entry = result_cache.get(key, generation)
+            if entry is not None:
+                self.set_result(entry.rows, entry.description)
+                return
+        if single_flight is not None:
+            rows, description = await single_flight.run(
+                (key, generation), self.fetch_result, sql, parameters)
+            if isinstance(rows, spool.Spool) and rows is not self.spool:
+                # A spilled result is read by one cursor, not shared.
+                rows, description = await loop.run_in_executor(
+                    None, self.fetch_result, sql, parameters)
+        else:
+            rows, description = await loop.run_in_executor(
+                None, self.fetch_result, sql, parameters)
+        self.store_result(key, generation, rows, description)
+
+    def fetch_result(self, sql, parameters):
+        """Return the rows of *sql*, a spool.Spool if they go over the
+        budgets of result_buffers, and their description.
+        """
+        self.cursor.execute(sql, parameters)
+        if result_buffers is None:
+            return self.cursor.fetchall(), self.cursor.description
+        # Unlike the rows of fetchall(), these stay in memory after the
+        # response, so their budget is only given back once fetched.
+        rows = result_buffers.collect(self.dispatcher.held, self.cursor)
+        if isinstance(rows, spool.Spool):
+            self.spool = rows
+        return rows, self.cursor.description
+
+    def store_result(self, key, generation, rows, description):
+        if isinstance(rows, spool.Spool):
+            self.result = spool.SpooledRows(rows, description,
+                                            self.cursor.lastrowid)
+            return
+        if result_cache is not None:
+            result_cache.put(key, generation, rows, description)
+        self.set_result(rows, description)
+
+    def clear_result(self):
+        self.result = None
+        if result_buffers is not None:
+            result_buffers.release(self.dispatcher.held)
+
+    def fetch_held(self, method):
+        """Wrap a fetch method of self.result to give back the budget of
+        its rows once they are all fetched.
+        """
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            rows = method(*args, **kwargs)
+            if self.result is not None and self.result.done \
+                    and result_buffers is not None:
+                result_buffers.release(self.dispatcher.held)
+            return rows
+        return wrapper
+
+    def set_result(self, rows, description):
+        self.result = cache.ResultCursor(rows, description,
+                                         self.cursor.lastrowid)
+
+    def execute_prepared(self, handle, parameters=(), deadline=None):
+        return self.execute(self.statement(handle), parameters, deadline)
+
+    def executemany(self, sql, seq_of_parameters):
+        self.clear_result()
+        self.close_spool()
+        self.begin_timing(sql)
+        self.dispatcher.deadline.start()
+        self.dispatcher.track(sql)
+        return self.cursor.executemany(sql, seq_of_parameters)
+
+    def executemany_prepared(self, handle, seq_of_parameters):
+        return self.executemany(self.statement(handle), seq_of_parameters)
+
+    def executemany_begin(self, sql):
+        """Start an executemany whose parameters come in later requests.
+        """
+        if isinstance(sql, int):
+            sql = self.statement(sql)
+        self.clear_result()
+        self.begin_timing(sql)
+        self.dispatcher.track(sql)
+
+        def executemany(parameters):
+            with atomic(self.connection, "csqlite3_executemany"):
+                self.cursor.executemany(sql, parameters)
+        self.upload = ParameterUpload(executemany, self.dispatcher.timeout)
+
+    async def executemany_chunk(self, chunk):
+        try:
+            await self.upload.put(chunk)
+        except BaseException:
+            self.upload = None
+            raise
+
+    async def executemany_end(self):
+        upload, self.upload = self.upload, None
+        await upload.finish()
+
+    async def executemany_abort(self):
+        upload, self.upload = self.upload, None
+        if upload is not None:
+            await upload.abort(sqlite3.OperationalError(
+                "executemany was aborted by the client."))
+
+    def executescript(self, sql_script):
+        self.clear_result()
+        self.close_spool()
+        self.begin_timing(sql_script)
+        self.dispatcher.deadline.start()
+        self.dispatcher.track(sql_script)
+        return self.cursor.executescript(sql_script)
+
+    def export(self, sql, parameters=(), format="csv", header=True,
+               compress=True, path=None):
+        """Export the result of *sql* to a file of the server if *path* is
+        given, else prepare its chunks for export_next().
+        """
+        self.clear_result()
+        self.begin_timing(sql, parameters)
+        self.dispatcher.deadline.start()
+        self.cursor.execute(sql, parameters)
+        progress = bulk.Progress()
+        chunks = bulk.export(self.cursor, format, header, progress)
+        if path is None:
+            import zlib
+            compressor = zlib.compressobj() if compress else None
+            self.exporting = chunks, progress, compressor
+            return None
+
+        def write():
+            with open(path, "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+            return progress.rows
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(None, write)
+
+    def export_next(self):
+        """Return the exported rows so far and the next chunk, that is
+        None at the end.
+        """
+        chunks, progress, compressor = self.exporting
+        chunk = next(chunks, None)
+        if chunk is None:
+            self.exporting = None
+        elif compressor is not None:
+            import zlib
+            chunk = compressor.compress(chunk) \
+                + compressor.flush(zlib.Z_SYNC_FLUSH)
+        return progress.rows, chunk
+
+    def fetchall(self):
+        """Return the remaining rows, or the next slice of them as
+        utils.Partial rows when they were spilled to disk.
+        """
+        if self.spool is None:
+            rows = result_buffers.collect(self.dispatcher.key, self.cursor)
+            if isinstance(rows, list):
+                return rows
+            self.spool = rows
+        rows = self.spool.next_slice()
+        if not self.spool.done:
+            return utils.Partial(rows)
+        self.close_spool()
+        return rows
+
+    def close_spool(self):
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+    def begin_timing(self, sql, parameters=()):
+        self.end_timing()
+        if slow_log is not None:
+            self.timing = slowlog.Statement(self.dispatcher.database, sql,
+                                            parameters)
+
+    def end_timing(self):
+        if self.timing is not None:
+            slow_log.record(self.timing)
+            self.timing = None
+
+    def add_time(self, start, rows=None):
+        if self.timing is not None:
+            self.timing.add(time.perf_counter() - start, rows)
+
+    async def add_time_after(self, awaitable, start):
+        try:
+            return await awaitable
+        finally:
+            self.add_time(start)
+
+    def timed(self, method, fetch=False, end=False):
+        """Wrap *method* to add its time, and its rows if *fetch*, to the
+        timed statement, that ends with it if *end*.
+        """
+        if slow_log is None:
+            return method
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except BaseException:
+                self.add_time(start)
+                raise
+            if inspect.isawaitable(result):
+                return self.add_time_after(result, start)
+            self.add_time(start, result if fetch else None)
+            if end and not isinstance(result, utils.Partial):
+                self.end_timing()
+            return result
+        return wrapper
+
+    def close(self):
+        self.clear_result()
+        self.exporting = None
+        self.close_spool()
+        self.end_timing()
+        return self.cursor.close()
+
+    def get_attribute(self, name):
+        if self.result is not None and hasattr(self.result, name):
+            return getattr(self.result, name)
+        return getattr(self.cursor, name)
+
     def __getitem__(self, item):
         if item == "open":
             return self.connector
         elif item == "_get_attribute":
-            return functools.partial(getattr, self.cursor)
+            return self.get_attribute
         elif item == "_set_attribute":
             return functools.partial(setattr, self.cursor)
+        elif item in self.methods:
+            return self.timed(self.dispatcher.deadline.wrap(
+                getattr(self, item)))
+        elif self.result is not None and item in self.result_methods:
+            return self.timed(self.fetch_held(getattr(self.result, item)),
+                              True, item == "fetchall")
+        elif item == "fetchall" and result_buffers is not None:
+            return self.timed(self.dispatcher.deadline.wrap(self.fetchall),
+                              True, True)
+        elif item in self.result_methods:
+            return self.timed(self.dispatcher.deadline.wrap(
+                getattr(self.cursor, item)), True, item == "fetchall")
         return getattr(self.cursor, item)
 
 
@@ -130,11 +915,23 @@ class ObjectDispatcher(collections.defaultdict):
             self["csqlite3"] = ModuleDispatcher(
                 active_client_apps[self.key[2]])
             return self["csqlite3"]
+        elif key == "admin":
+            self["admin"] = AdminDispatcher()
+            return self["admin"]
         else:
             raise KeyError
 
 
 class Database(collections.defaultdict):
+    # Calls that run in the executor while they hold the turn of their
+    # database, so the requests of the other clients queue meanwhile.
+    threaded = {("connection", "commit"), ("connection", "rollback"),
+                ("connection", "run_batch"), ("cursor", "execute"),
+                ("cursor", "execute_prepared"), ("cursor", "executemany"),
+                ("cursor", "executemany_prepared"),
+                ("cursor", "executescript"), ("cursor", "fetchone"),
+                ("cursor", "fetchmany"), ("cursor", "fetchall")}
+
     def __missing__(self, key):
         self[key] = ObjectDispatcher(key)
         return self[key]
@@ -143,7 +940,14 @@ class Database(collections.defaultdict):
         with client:
             status = None
             while status is not StopIteration:
-                request = await reader(client)
+                try:
+                    request = await reader(client)
+                except utils.ServerBusyError as error:
+                    await writer(client, utils.ServerError(error))
+                    continue
+                except EOFError:
+                    # The client closed its socket after its last request.
+                    break
                 if request:
                     try:
                         status = await self.handle_request(
@@ -156,6 +960,11 @@ class Database(collections.defaultdict):
                         await self.handle_exception(
                             error, writer, client, host, port, *request)
                         status = StopIteration
+                    finally:
+                        if admission is not None:
+                            admission.release(client)
+                        if result_buffers is not None:
+                            result_buffers.release((host, port, request[0]))
                 else:
                     status = await self.warn(writer, client, host, port)
 
@@ -167,6 +976,61 @@ class Database(collections.defaultdict):
         logger.error(message, extra=extra)
         await writer(client, message)
 
+    def database_key(self, host, port, pid):
+        """Return the database of a client, or the client itself for
+        databases that aren't shared.
+        """
+        dispatcher = self[host, port, pid].get("connection")
+        database = dispatcher.database if dispatcher else None
+        return database or (host, port, pid)
+
+    @staticmethod
+    def is_grouped(dispatcher, obj, method, arguments):
+        # Group commit gathers writes of many clients, so they must not
+        # wait for each other's turn.
+        return obj == "cursor" and method == "execute" \
+            and isinstance(arguments, (list, tuple)) and arguments \
+            and dispatcher.can_group(arguments[0])
+
+    def queue(self, host, port, pid, obj):
+        """Count the request in the queue of its database."""
+        if admission is None or obj not in ("connection", "cursor"):
+            return contextlib.nullcontext()
+        return admission.queue(self.database_key(host, port, pid))
+
+    @contextlib.asynccontextmanager
+    async def turn(self, host, port, pid, obj, method, arguments):
+        """Wait for the turn of the request on its database, and yield
+        True if the request is scheduled.
+        """
+        dispatcher = self[host, port, pid].get("connection")
+        if scheduler is None or obj not in ("connection", "cursor") \
+                or dispatcher is None or dispatcher.connection is None \
+                or self.is_grouped(dispatcher, obj, method, arguments):
+            yield False
+            return
+        async with scheduler.turn(self.database_key(host, port, pid),
+                                  (host, port, pid), dispatcher.priority):
+            yield True
+
+    def after_request(self, host, port, pid):
+        dispatcher = self[host, port, pid].get("connection")
+        if dispatcher is not None and dispatcher.connection is not None:
+            dispatcher.after_request()
+
+    def advise(self, host, port, pid, method, arguments):
+        """Show an executed statement to the index advisor, and return
+        the future of its analysis, if any.
+        """
+        dispatcher = self[host, port, pid]["connection"]
+        if isinstance(arguments, dict):
+            arguments = [arguments.get("sql", arguments.get("handle")),
+                         arguments.get("parameters", ())]
+        sql, parameters = (list(arguments) + [()])[:2]
+        if method == "execute_prepared":
+            sql = dispatcher.statement(sql)
+        return index_advisor.observe(dispatcher.database, sql, parameters)
+
     async def handle_request(self, writer, client, host, port, pid, obj,
                              method, arguments):
         if (obj == "close") and (method == "client_app"):
@@ -175,10 +1039,30 @@ class Database(collections.defaultdict):
                      "method": method, "arguments": arguments}
             logger.debug("Client app was closed.", extra=extra)
             return StopIteration
-        if isinstance(arguments, dict):
-            message = self[host, port, pid][obj][method](**arguments)
-        else:
-            message = self[host, port, pid][obj][method](*arguments)
+        with self.queue(host, port, pid, obj):
+            async with self.turn(host, port, pid, obj, method,
+                                 arguments) as scheduled:
+                function = self[host, port, pid][obj][method]
+                if isinstance(arguments, dict):
+                    call = functools.partial(function, **arguments)
+                else:
+                    call = functools.partial(function, *arguments)
+                if scheduled and (obj, method) in self.threaded:
+                    loop = asyncio.get_event_loop()
+                    message = await loop.run_in_executor(None, call)
+                else:
+                    message = call()
+                if inspect.isawaitable(message):
+                    message = await message
+                if obj in ("connection", "cursor") and method != "close":
+                    self.after_request(host, port, pid)
+        if index_advisor is not None and obj == "cursor" \
+                and method in ("execute", "execute_prepared"):
+            self.advise(host, port, pid, method, arguments)
+        if (obj, method) == ("connection", "open"):
+            codec = self[host, port, pid]["connection"].codec
+            if codec is not None:
+                utils.SOCKET_CODECS[client] = codec
         if isinstance(message, sqlite3.Cursor):
             message = None
         logger.debug(message, extra={"host": host, "port": port, "pid": pid,
@@ -187,6 +1071,10 @@ class Database(collections.defaultdict):
         await writer(client, message)
         if (obj == "close") and (method == "connection"):
             return StopIteration
+        if obj == "admin":
+            # admin.py sends one request per socket, then closes it.
+            self.pop((host, port, pid), None)
+            return StopIteration
 
     async def warn(self, writer, client, host, port):
         warning = RuntimeWarning("Unexpected close connection")
@@ -197,20 +1085,30 @@ class Database(collections.defaultdict):
         return StopIteration
 
 
-async def new_monitor():
+async def new_monitor(directory="bench", pid=None):
+    """Sample CPU and memory usage into two CSV files of *directory*.
+
+    The whole system is sampled unless *pid* is given, in that case
+    only the CPU percent and RSS of that process are written.
+    """
     import psutil
     import pathlib
     import csv
 
-    bench = pathlib.Path("bench")
+    bench = pathlib.Path(directory)
+    process = psutil.Process(pid) if pid else None
     with open(bench/"cpu_percent.csv", "w", newline="") as cpu_file, \
          open(bench/"memory_usage.csv", "w", newline="") as memory_file:
         while True:
             cpu_writer = csv.writer(cpu_file)
             memory_writer = csv.writer(memory_file)
 
-            cpu_percent = psutil.cpu_percent(interval=0.1, percpu=True)
-            memory_usage = [psutil.virtual_memory().used]
+            if process:
+                cpu_percent = [process.cpu_percent(interval=0.1)]
+                memory_usage = [process.memory_info().rss]
+            else:
+                cpu_percent = psutil.cpu_percent(interval=0.1, percpu=True)
+                memory_usage = [psutil.virtual_memory().used]
 
             cpu_writer.writerow(cpu_percent)
             memory_writer.writerow(memory_usage)
@@ -221,25 +1119,52 @@ async def new_monitor():
             await asyncio.sleep(0.2)
 
 
-def main():
-    loop = asyncio.get_event_loop()
+def serve(host, port, loop=None):
+    """Run a server on (*host*, *port*) until it is interrupted."""
+    loop = loop or asyncio.get_event_loop()
+    logger.loop = loop
     handler = Database().handler
-    database_server = utils.new_server(utils.HOST, utils.PORT, handler, loop)
+    database_server = utils.new_server(host, port, handler, loop, admission)
     logging_server = logger.new_server()
+    memory_server = memory_databases.run()
+    servers = [database_server, logging_server, memory_server]
+    if slow_log is not None:
+        slowlog.logger.loop = loop
+        servers.append(slowlog.logger.new_server())
     # monitor = new_monitor()
-    _extra = {"host": utils.HOST, "port": utils.PORT, "pid": "",
+    _extra = {"host": host, "port": port, "pid": "",
               "obj": "", "method": "", "arguments": {}}
     logger.info("csqlite3.server has been started.", extra=_extra)
     try:
         # tasks = asyncio.gather(database_server, logging_server, monitor)
-        tasks = asyncio.gather(database_server, logging_server)
+        tasks = asyncio.gather(*servers)
         loop.run_until_complete(tasks)
     except KeyboardInterrupt:
+        memory_databases.save()
         logger.info_now("csqlite3.server has been closed.", extra=_extra)
+        logger.close()
+        slowlog.logger.close()
         loop.stop()
     finally:
         loop.close()
 
 
+def main():
+    utils.configure_logging()
+    parser = argparse.ArgumentParser(description="Run the csqlite3 server.")
+    parser.add_argument("--workers", type=int,
+                        default=utils.CONFIG.getint("server", "workers",
+                                                    fallback=0),
+                        help="worker processes, each database file is "
+                             "always served by the same one (default: 0, "
+                             "a single process)")
+    options = parser.parse_args()
+    if options.workers > 0:
+        from . import supervisor
+        supervisor.main(utils.HOST, utils.PORT, options.workers)
+    else:
+        serve(utils.HOST, utils.PORT)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,128 @@
+"""Client side routing of shard keys to csqlite3 servers.
+
+A strategy maps a shard key to a Shard, that is the (host, port) address
+of a server and the path of a database on it. The Router keeps one open
+connection per shard and reuses it for every key of that shard, and
+scatter() runs a read on all the shards in parallel and merges the rows.
+
+    router = Router(HashStrategy([
+        Shard(("127.0.0.4", 8888), "tenants-0.db"),
+        Shard(("127.0.0.5", 8888), "tenants-1.db"),
+    ]))
+    router.execute(tenant_id, "SELECT * FROM orders WHERE tenant=?",
+                   (tenant_id,))
+    router.scatter("SELECT count(*) FROM orders")
+
+Any callable that takes a key and returns a Shard, and has a ``shards``
+attribute listing all of them, can be used as strategy.
+"""
+import collections
+import concurrent.futures
+import heapq
+import itertools
+import threading
+
+from . import client
+from . import utils
+
+
+Shard = collections.namedtuple("Shard", ["address", "database"])
+
+
+class HashStrategy:
+    """Spread keys over *shards* by consistent hashing, so adding a shard
+    only moves the keys that the new shard takes.
+    """
+    def __init__(self, shards, replicas=100):
+        self.shards = [Shard(*shard) for shard in shards]
+        self.ring = utils.HashRing(self.shards, replicas)
+
+    def __call__(self, key):
+        return self.ring[key]
+
+
+class MappingStrategy:
+    """Look keys up in *mapping*, unknown keys go to *default*."""
+    def __init__(self, mapping, default=None):
+        self.mapping = {key: Shard(*shard) for key, shard in mapping.items()}
+        self.default = Shard(*default) if default else None
+        self.shards = list(dict.fromkeys(itertools.chain(
+            self.mapping.values(), [self.default] if default else [])))
+
+    def __call__(self, key):
+        shard = self.mapping.get(key, self.default)
+        if shard is None:
+            raise KeyError("No shard for key %r" % (key,))
+        return shard
+
+
+class Router:
+    """Connections to the shards of *strategy*, opened on first use with
+    the keyword arguments of connect() given in *options*.
+    """
+    def __init__(self, strategy, max_workers=None, **options):
+        self.strategy = strategy
+        self.options = options
+        self.max_workers = max_workers
+        self.connections = {}
+        self.locks = collections.defaultdict(threading.Lock)
+        self.lock = threading.Lock()
+
+    def shard(self, key):
+        return self.strategy(key)
+
+    def connection(self, shard):
+        """Return the connection of *shard*, it is opened only once."""
+        with self.lock:
+            if shard not in self.connections:
+                self.connections[shard] = client.connect(
+                    shard.database, address=tuple(shard.address),
+                    **self.options)
+            return self.connections[shard]
+
+    def connect(self, key):
+        """Return the connection of the shard of *key*."""
+        return self.connection(self.shard(key))
+
+    def execute(self, key, sql, parameters=()):
+        """Execute *sql* on the shard of *key* and return its rows."""
+        return self.query(self.shard(key), sql, parameters)
+
+    def query(self, shard, sql, parameters=()):
+        # A connection is one socket, so requests of a shard are serialized.
+        with self.locks[shard]:
+            return self.connection(shard).execute(sql, parameters).fetchall()
+
+    def scatter(self, sql, parameters=(), key=None, reverse=False):
+        """Run *sql* on every shard in parallel and return all the rows.
+
+        Rows are concatenated in shard order, or merged with *key* when
+        each shard already returns them sorted by it, e.g. with the same
+        ORDER BY.
+        """
+        shards = self.strategy.shards
+        workers = self.max_workers or len(shards)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            results = list(executor.map(
+                lambda shard: self.query(shard, sql, parameters), shards))
+        if key is None:
+            return list(itertools.chain.from_iterable(results))
+        return list(heapq.merge(*results, key=key, reverse=reverse))
+
+    def commit(self):
+        """Commit the open transaction of every connected shard."""
+        for shard, connection in list(self.connections.items()):
+            with self.locks[shard]:
+                connection.commit()
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
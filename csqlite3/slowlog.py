@@ -0,0 +1,172 @@
+"""Timing of the statements run by the server.
+
+Every statement is timed from its execute() to the end of its result,
+that is the next statement of the cursor, its close() or a complete
+fetchall(), since SQLite runs the statement while the rows are fetched.
+Statements are aggregated by their normalized SQL, where literals are
+replaced by ``?``, and the ones slower than *threshold* seconds are
+written to the "SlowLog" logger (logs/slow.log) as JSON together with
+their EXPLAIN QUERY PLAN, captured on a side connection of the database
+in the executor.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from . import cache
+from . import utils
+
+
+LITERAL = re.compile(r"[xX]'[0-9a-fA-F]*'|'(?:[^']|'')*'"
+                     r"|(?<![\w.?:$@])\d+(?:\.\d*)?(?:[eE][-+]?\d+)?")
+PLACEHOLDERS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+logger = utils.SafeLogger("SlowLog")
+
+
+def normalize(sql):
+    """Return *sql* with its literals replaced by ``?``, lists of them
+    shortened and its white space collapsed.
+    """
+    sql = LITERAL.sub("?", sql)
+    sql = PLACEHOLDERS.sub("(?, ...)", sql)
+    return " ".join(sql.split())
+
+
+def shape(parameters):
+    """Return the type names of *parameters*, by name for a mapping."""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__
+                for name, value in sorted(parameters.items())}
+    try:
+        return [type(value).__name__ for value in parameters]
+    except TypeError:
+        return type(parameters).__name__
+
+
+class Statement:
+    """A statement being timed."""
+    def __init__(self, database, sql, parameters):
+        self.database = database
+        self.sql = sql
+        self.parameters = parameters
+        self.duration = 0.0
+        self.rows = 0
+
+    def add(self, duration, rows=None):
+        """Add *duration* seconds and the fetched *rows*, a list or one
+        row.
+        """
+        self.duration += duration
+        if isinstance(rows, list):
+            self.rows += len(rows)
+        elif rows is not None:
+            self.rows += 1
+
+
+class SlowLog:
+    """Statistics of the statements by normalized SQL, and log of the
+    ones slower than *threshold* seconds.
+    """
+    def __init__(self, threshold=0.1, timeout=1):
+        self.threshold = threshold
+        self.timeout = timeout
+        self.stats = {}
+        self.connections = {}
+        # The slow statements are explained in the threads of the executor,
+        # where the statements of scheduled requests also end.
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return an instance if [slowlog] enables it, else None."""
+        if not config.has_section("slowlog"):
+            return None
+        section = config["slowlog"]
+        if not section.getboolean("enabled", False):
+            return None
+        return cls(section.getfloat("threshold", 0.1))
+
+    def record(self, statement):
+        """Add *statement* to the statistics and log it if it is slow, in
+        the executor when it is called on the event loop. Return the future
+        of the log entry in that case.
+        """
+        if not isinstance(statement.sql, str):
+            return None
+        normalized = normalize(statement.sql)
+        with self.stats_lock:
+            stats = self.stats.get(normalized)
+            if stats is None:
+                stats = self.stats[normalized] = {"calls": 0, "total": 0.0,
+                                                  "max": 0.0, "rows": 0,
+                                                  "slow": 0}
+            stats["calls"] += 1
+            stats["total"] += statement.duration
+            stats["rows"] += statement.rows
+            stats["max"] = max(stats["max"], statement.duration)
+            if statement.duration < self.threshold:
+                return None
+            stats["slow"] += 1
+        when = time.strftime("%Y-%m-%dT%H:%M:%S")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Statements of scheduled requests end in the executor.
+            self.log(statement, normalized, when)
+            return None
+        return loop.run_in_executor(None, self.log, statement, normalized,
+                                    when)
+
+    def log(self, statement, normalized, when):
+        logger.info(json.dumps({
+            "time": when,
+            "database": statement.database,
+            "duration": round(statement.duration, 6),
+            "sql": normalized,
+            "parameters": shape(statement.parameters),
+            "rows": statement.rows,
+            "plan": self.explain(statement),
+        }))
+
+    def explain(self, statement):
+        """Return the EXPLAIN QUERY PLAN of *statement*, or None if its
+        database can't be opened by another connection.
+        """
+        database = statement.database
+        if not cache.is_shared_database(database):
+            return None
+        try:
+            with self.lock:
+                if database not in self.connections:
+                    self.connections[database] = sqlite3.connect(
+                        database, timeout=self.timeout,
+                        check_same_thread=False,
+                        uri=database.startswith("file:"))
+                cursor = self.connections[database].execute(
+                    "EXPLAIN QUERY PLAN " + statement.sql,
+                    statement.parameters)
+                return [row[-1] for row in cursor]
+        except sqlite3.Error:
+            return None
+
+    def report(self, top=None):
+        """Return the statistics of the *top* statements by total time."""
+        with self.stats_lock:
+            ordered = sorted(self.stats.items(),
+                             key=lambda item: item[1]["total"], reverse=True)
+            return {sql: dict(stats, mean=stats["total"] / stats["calls"])
+                    for sql, stats in ordered[:top]}
+
+    def reset(self):
+        with self.stats_lock:
+            self.stats.clear()
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections.values():
+                connection.close()
+            self.connections.clear()
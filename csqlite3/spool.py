@@ -0,0 +1,183 @@
+"""Result buffers of the server under a memory budget.
+
+fetchall() reads the rows of a cursor in chunks. The chunks are kept in
+memory while the session and the whole server are under their budgets,
+a result that goes over is spilled to a temporary file instead. The
+memory of a session is given back once its response has been written.
+
+A spilled result is sent in slices of about *slice_bytes*: fetchall()
+answers with utils.Partial rows until the last slice and the client
+asks again, so neither the rows nor their pickle are ever whole in the
+memory of the server.
+
+The cacheable reads, that are fetched when they are executed, get the
+same budgets: a result that goes over is served from its Spool through a
+SpooledRows view and is not cached. The memory of a result that fits is
+held until the cursor has fetched all its rows or is closed. Once in the
+result cache, rows only count against the max_bytes of the cache.
+"""
+import collections
+import mmap
+import pickle
+import tempfile
+import threading
+
+from . import utils
+
+
+class Spool:
+    """Pickled chunks of rows in a temporary file, read back in slices
+    of about *slice_bytes* through a read-only memory map.
+    """
+    def __init__(self, slice_bytes):
+        self.slice_bytes = slice_bytes
+        self.file = tempfile.TemporaryFile()
+        self.chunks = collections.deque()
+        self.offset = 0
+        self.map = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        data = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+        self.file.write(data)
+        self.chunks.append((self.offset, len(data)))
+        self.offset += len(data)
+
+    @property
+    def done(self):
+        return not self.chunks
+
+    def next_slice(self):
+        """Return the rows of the next slice."""
+        if self.map is None:
+            self.file.flush()
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        rows, size = [], 0
+        while self.chunks and size < self.slice_bytes:
+            offset, length = self.chunks.popleft()
+            rows.extend(pickle.loads(self.map[offset:offset + length]))
+            size += length
+        return rows
+
+    def close(self):
+        self.chunks.clear()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class SpooledRows:
+    """Cursor-like view of the rows of a Spool, whose fetchall() returns
+    utils.Partial rows until the last slice.
+    """
+    def __init__(self, spool, description, lastrowid=None):
+        self.spool = spool
+        self.description = description
+        self.lastrowid = lastrowid
+        self.rowcount = -1
+        self.rows = collections.deque()
+
+    @property
+    def done(self):
+        return not self.rows and self.spool.done
+
+    def fetchmany(self, size=1):
+        while len(self.rows) < size and not self.spool.done:
+            self.rows.extend(self.spool.next_slice())
+        return [self.rows.popleft()
+                for _ in range(min(size, len(self.rows)))]
+
+    def fetchone(self):
+        rows = self.fetchmany()
+        return rows[0] if rows else None
+
+    def fetchall(self):
+        rows = list(self.rows)
+        self.rows.clear()
+        if not self.spool.done:
+            rows.extend(self.spool.next_slice())
+        if not self.spool.done:
+            return utils.Partial(rows)
+        self.spool.close()
+        return rows
+
+    def close(self):
+        self.rows.clear()
+        self.spool.close()
+
+
+class ResultBuffers:
+    """Memory budget of the fetchall() results, per session and in total.
+    """
+    def __init__(self, session_bytes=16 * 1024 * 1024,
+                 total_bytes=128 * 1024 * 1024, slice_bytes=1024 * 1024,
+                 chunk_rows=256):
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        self.slice_bytes = slice_bytes
+        self.chunk_rows = chunk_rows
+        self.used = 0
+        self.sessions = collections.Counter()
+        self.stats = collections.Counter()
+        # collect() also runs in the threads of the executor.
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return an instance if [buffers] enables it, else None."""
+        if not config.has_section("buffers"):
+            return None
+        section = config["buffers"]
+        if not section.getboolean("enabled", False):
+            return None
+        return cls(section.getint("session_bytes", 16 * 1024 * 1024),
+                   section.getint("total_bytes", 128 * 1024 * 1024),
+                   section.getint("slice_bytes", 1024 * 1024))
+
+    def reserve(self, session, size):
+        """Take *size* bytes of the budgets for *session*, if they fit."""
+        with self.lock:
+            if self.used + size > self.total_bytes \
+                    or self.sessions[session] + size > self.session_bytes:
+                return False
+            self.used += size
+            self.sessions[session] += size
+            return True
+
+    def release(self, session, size=None):
+        """Give back *size* bytes, or all the memory, of *session*."""
+        with self.lock:
+            if size is None:
+                size = self.sessions.pop(session, 0)
+            else:
+                self.sessions[session] -= size
+            self.used -= size
+
+    def collect(self, session, cursor):
+        """Return the remaining rows of *cursor*, as a list if they fit
+        in the budgets of *session*, else as a Spool.
+        """
+        rows, size = [], 0
+        spool = None
+        while True:
+            chunk = cursor.fetchmany(self.chunk_rows)
+            if not chunk:
+                break
+            if spool is not None:
+                spool.write(chunk)
+                continue
+            chunk_size = len(pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL))
+            if self.reserve(session, chunk_size):
+                rows.extend(chunk)
+                size += chunk_size
+                continue
+            spool = Spool(self.slice_bytes)
+            spool.write(rows)
+            spool.write(chunk)
+            rows = None
+            self.release(session, size)
+        with self.lock:
+            self.stats["buffered" if spool is None else "spilled"] += 1
+        return rows if spool is None else spool
@@ -0,0 +1,162 @@
+"""Multi-process mode of the server.
+
+The supervisor listens on the configured address and forks worker
+processes that listen on the next ports. Every database file is always
+served by the same worker, chosen by consistent hashing of its resolved
+path, so writers of one database never race each other across processes
+and the worker caches stay warm. Opening a connection on the supervisor
+answers with the address of that worker and the client reconnects there.
+Module level and admin requests are sent to every worker, except the
+admin requests of a named in-memory database, that only its worker
+serves. Workers write the files of start_profiling() to <path>.<n>, n
+being their number from 1, so they don't overwrite each other.
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import sqlite3
+
+from . import cache
+from . import memory
+from . import server
+from . import utils
+
+
+BROADCAST = ("csqlite3", "client_app", "admin")
+# Admin methods that write their path argument, in every worker.
+WORKER_PATHS = {"start_profiling"}
+# Admin methods of the in-memory database of their name argument.
+MEMORY = {"snapshot", "drop_memory"}
+
+
+def route_key(pid, arguments):
+    """Return the key that picks the worker of a connection.open request.
+    """
+    if isinstance(arguments, dict):
+        database = arguments.get("database", "")
+        uri = arguments.get("uri", False)
+    else:
+        database = arguments[0] if arguments else ""
+        uri = len(arguments) > 6 and arguments[6]
+    name = memory.name_of(database)
+    if name is not None:
+        return memory.uri(name)
+    if not cache.is_shared_database(database):
+        # Named in-memory databases are shared, private ones are not.
+        return database if "cache=shared" in database else pid
+    if uri:
+        database = database.split("?")[0]
+        if database.startswith("file:"):
+            database = database[len("file:"):]
+    return os.path.abspath(database)
+
+
+def forward(address, request, timeout=5):
+    """Send *request* to the worker at *address* and return its answer."""
+    with utils.PickleSocket(socket.AF_INET, socket.SOCK_STREAM) as _socket:
+        _socket.settimeout(timeout)
+        _socket.connect(address)
+        _socket.write(request)
+        return _socket.read()
+
+
+def run_worker(host, port, addresses):
+    # Each named in-memory database is loaded and saved by its worker.
+    ring = utils.HashRing(addresses)
+    databases = server.memory_databases
+    databases.settings = {
+        name: settings for name, settings in databases.settings.items()
+        if ring[route_key(None, [memory.PREFIX + name])] == (host, port)}
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    server.serve(host, port, loop)
+
+
+class Supervisor:
+    def __init__(self, addresses):
+        self.addresses = list(addresses)
+        self.ring = utils.HashRing(self.addresses)
+
+    def route(self, pid, arguments):
+        return self.ring[route_key(pid, arguments)]
+
+    async def broadcast(self, request):
+        """Send *request* to every worker and return their answers."""
+        loop = asyncio.get_event_loop()
+        return await asyncio.gather(*[
+            loop.run_in_executor(None, forward, address,
+                                 self.for_worker(request, number))
+            for number, address in enumerate(self.addresses, 1)])
+
+    @staticmethod
+    def for_worker(request, number):
+        """Return *request* with the path of worker *number*."""
+        pid, obj, method, arguments = request
+        if obj == "admin" and method in WORKER_PATHS \
+                and arguments.get("path"):
+            arguments = dict(arguments,
+                             path="%s.%d" % (arguments["path"], number))
+        return pid, obj, method, arguments
+
+    async def handle_request(self, pid, obj, method, arguments):
+        if (obj, method) == ("connection", "open"):
+            return utils.Redirect(self.route(pid, arguments))
+        if obj not in BROADCAST:
+            error = sqlite3.ProgrammingError(
+                "%s.%s must be sent to a worker." % (obj, method))
+            return utils.ServerError(error)
+        if obj == "admin" and method in MEMORY:
+            address = self.route(pid, [memory.PREFIX + arguments["name"]])
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                None, forward, address, (pid, obj, method, arguments))
+        answers = await self.broadcast((pid, obj, method, arguments))
+        if obj == "admin":
+            return answers
+        # Only the workers that know the client app can answer it.
+        for answer in answers:
+            if not isinstance(answer, utils.ServerError):
+                return answer
+        return answers[0]
+
+    async def handler(self, reader, writer, client, host, port):
+        with client:
+            while True:
+                try:
+                    request = await reader(client)
+                except (EOFError, ConnectionError):
+                    return
+                if not request:
+                    return
+                try:
+                    answer = await self.handle_request(*request)
+                except (OSError, EOFError) as error:
+                    answer = utils.ServerError(
+                        sqlite3.OperationalError("Worker failed: %s" % error))
+                await writer(client, answer)
+
+
+def main(host, port, workers):
+    """Fork *workers* processes on the ports after *port* and route the
+    clients of (*host*, *port*) to them.
+    """
+    context = multiprocessing.get_context("fork")
+    addresses = [(host, port + index) for index in range(1, workers + 1)]
+    processes = [context.Process(target=run_worker,
+                                 args=(*address, addresses), daemon=True)
+                 for address in addresses]
+    for process in processes:
+        process.start()
+    loop = asyncio.get_event_loop()
+    supervisor = Supervisor(addresses)
+    try:
+        loop.run_until_complete(
+            utils.new_server(host, port, supervisor.handler, loop))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        loop.close()
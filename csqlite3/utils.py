@@ -1,29 +1,81 @@
-import asyncio
+import bisect
 import collections
-import configparser
+import contextlib
 import importlib
 import logging
-import logging.config
 import pathlib
 import pickle
 import socket
-import socketserver
+import sqlite3
 import struct
 import sys
 import queue
+import re
+import weakref
 
 
 BASE = pathlib.Path(__file__).parent
 
 
-CONFIG = configparser.ConfigParser()
-CONFIG.read(BASE/"config.ini")
-HOST = CONFIG["address"]["host"]
-PORT = CONFIG["address"].getint("port")
 progress = {}
-
-logging.config.fileConfig(BASE/"config.ini")
 logger = logging.getLogger("Server")
+_config = None
+
+
+# Clients only need the server address, so the configuration is read on
+# first use of CONFIG, HOST or PORT and importing csqlite3 stays cheap.
+def load_config():
+    """Return the parsed config.ini, it is read only once."""
+    global _config
+    if _config is None:
+        import configparser
+
+        config = configparser.ConfigParser()
+        config.read(BASE/"config.ini")
+        _config = config
+    return _config
+
+
+def __getattr__(name):
+    if name == "CONFIG":
+        return load_config()
+    elif name == "HOST":
+        return load_config()["address"]["host"]
+    elif name == "PORT":
+        return load_config()["address"].getint("port")
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def configure_logging():
+    """Set up the server loggers of config.ini, only the server calls it
+    because it truncates logs/server.log.
+    """
+    import logging.config
+
+    pathlib.Path("logs").mkdir(exist_ok=True)
+    logging.config.fileConfig(BASE/"config.ini",
+                              disable_existing_loggers=False)
+
+
+WRITE = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def is_write(sql):
+    """Return True if *sql* is a single INSERT, UPDATE, DELETE or REPLACE.
+    """
+    return isinstance(sql, str) and bool(WRITE.match(sql)) \
+        and ";" not in sql.strip().rstrip(";")
+
+
+LOCAL = re.compile(r"(?:^|;)\s*(?:PRAGMA|ATTACH|CREATE\s+TEMP(?:ORARY)?\b"
+                   r"|CREATE\b[^;(]*\btemp\s*\.)", re.IGNORECASE)
+
+
+def is_local(sql):
+    """Return True if *sql* may set PRAGMAs, attach databases or create
+    TEMP objects, that only its connection sees.
+    """
+    return isinstance(sql, str) and bool(LOCAL.search(sql))
 
 
 Log = collections.namedtuple("Log", ["asctime", "levelname", "host", "port",
@@ -34,49 +86,245 @@ def as_log(line):
     return eval("Log(%s)" % line)
 
 
+# Compressed frames have a negative size in their header and start with
+# the id of their codec.
+CODECS = {"zlib": 1, "lzma": 2}
+CODEC_NAMES = {number: name for name, number in CODECS.items()}
+
+
+class Codec:
+    """Compression of the frames of one socket that are at least
+    *threshold* bytes long, with counters of the bytes before and after.
+    """
+    def __init__(self, name="zlib", threshold=1024):
+        if name not in CODECS:
+            raise sqlite3.ProgrammingError("Unknown compression: %r" % name)
+        self.name = name
+        self.threshold = threshold
+        self.module = importlib.import_module(name)
+        self.stats = collections.Counter()
+
+    def count(self, direction, raw, wire):
+        self.stats[direction + "_raw"] += raw
+        self.stats[direction + "_wire"] += wire
+
+
+# Codecs negotiated by the clients of the server, by socket.
+SOCKET_CODECS = weakref.WeakKeyDictionary()
+
+
+def pack_frame(data, codec=None):
+    """Return the header and body of the pickled *data*."""
+    if codec is not None and len(data) >= codec.threshold:
+        body = bytes([CODECS[codec.name]]) + codec.module.compress(data)
+        if len(body) < len(data):
+            codec.count("sent", len(data) + 4, len(body) + 4)
+            return struct.pack("!i", -len(body)) + body
+    if codec is not None:
+        codec.count("sent", len(data) + 4, len(data) + 4)
+    return struct.pack("!i", len(data)) + data
+
+
+def unpack_body(size, body, codec=None):
+    """Return the pickled data of a frame whose header had *size*."""
+    if size < 0:
+        name = CODEC_NAMES[body[0]]
+        module = codec.module if codec and codec.name == name \
+            else importlib.import_module(name)
+        data = module.decompress(body[1:])
+    else:
+        data = body
+    if codec is not None:
+        codec.count("received", len(data) + 4, len(body) + 4)
+    return data
+
+
 class PickleSocket(socket.socket):
+    codec = None
+
     def write(self, message):
         data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
-        size = len(data)
-        header = struct.pack("!i", size)
-        self.sendall(header + data)
+        self.sendall(pack_frame(data, self.codec))
 
     def read(self):
         header = self.recv(4)
         if header:
             size = struct.unpack("!i", header)[0]
-            return pickle.loads(self.recv(size))
+            body = self.recv_exactly(abs(size))
+            return pickle.loads(unpack_body(size, body, self.codec))
         else:
             return pickle.loads(self.recv(0))
 
+    def recv_exactly(self, size):
+        """Receive *size* bytes, large frames arrive in many segments."""
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
     def close(self):
         super().close()
 
 
-async def new_server(host, port, handler, loop):
+# Outcome of one statement of Connection.run_batch(), rows is None unless
+# the statement was fetched.
+BatchResult = collections.namedtuple("BatchResult",
+                                     ["rowcount", "lastrowid", "rows"])
+
+
+class ServerBusyError(sqlite3.OperationalError):
+    """The server is overloaded and refused the request, retry later."""
+
+
+class DeadlineExceededError(sqlite3.OperationalError):
+    """A statement was interrupted because it ran past its deadline."""
+
+
+class Admission:
+    """Limits that make an overloaded server refuse work fast.
+
+    *max_sessions* open client sockets, *max_queued* requests in progress
+    per database and *max_inflight_bytes* of request frames being read or
+    handled. Zero means unlimited.
+    """
+    def __init__(self, max_sessions=0, max_queued=0, max_inflight_bytes=0,
+                 backlog=128):
+        self.max_sessions = max_sessions
+        self.max_queued = max_queued
+        self.max_inflight_bytes = max_inflight_bytes
+        self.backlog = backlog
+        self.sessions = 0
+        self.inflight_bytes = 0
+        self.frames = {}
+        self.queued = collections.Counter()
+        self.stats = collections.Counter()
+
+    @classmethod
+    def from_config(cls, config):
+        """Return the limits of the [limits] section, or None."""
+        if not config.has_section("limits"):
+            return None
+        section = config["limits"]
+        return cls(section.getint("max_sessions", 0),
+                   section.getint("max_queued", 0),
+                   section.getint("max_inflight_bytes", 0),
+                   section.getint("backlog", 128))
+
+    def refuse(self, reason):
+        self.stats[reason] += 1
+        raise ServerBusyError("Server busy: too many %s." % reason)
+
+    def open_session(self):
+        if self.max_sessions and self.sessions >= self.max_sessions:
+            self.refuse("sessions")
+        self.sessions += 1
+
+    def close_session(self):
+        self.sessions -= 1
+
+    def reserve(self, sock, size):
+        """Account a request frame of *size* bytes read from *sock*."""
+        if self.max_inflight_bytes \
+                and self.inflight_bytes + size > self.max_inflight_bytes:
+            self.refuse("in-flight bytes")
+        self.inflight_bytes += size
+        self.frames[sock] = size
+
+    def release(self, sock):
+        """Forget the frame of *sock* once its request is answered."""
+        self.inflight_bytes -= self.frames.pop(sock, 0)
+
+    @contextlib.contextmanager
+    def queue(self, key):
+        """Count a request in progress on the database *key*."""
+        if self.max_queued and self.queued[key] >= self.max_queued:
+            self.refuse("queued requests")
+        self.queued[key] += 1
+        try:
+            yield
+        finally:
+            self.queued[key] -= 1
+            if not self.queued[key]:
+                del self.queued[key]
+
+
+async def new_server(host, port, handler, loop, admission=None):
+    import asyncio
+
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     sock.bind((host, port))
-    sock.listen(5)
+    sock.listen(admission.backlog if admission else 5)
     sock.setblocking(False)
 
+    async def recv_exactly(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = await loop.sock_recv(sock, size - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    async def discard(sock, size):
+        while size > 0:
+            chunk = await loop.sock_recv(sock, min(size, 65536))
+            if not chunk:
+                break
+            size -= len(chunk)
+
     async def reader(sock):
         header = await loop.sock_recv(sock, 4)
         if header:
-            data = await loop.sock_recv(sock, *struct.unpack("!i", header))
+            size = struct.unpack("!i", header)[0]
+            if admission is not None:
+                try:
+                    admission.reserve(sock, abs(size))
+                except ServerBusyError:
+                    # Keep the stream in step for the next request.
+                    await discard(sock, abs(size))
+                    raise
+            body = await recv_exactly(sock, abs(size))
+            data = unpack_body(size, body, SOCKET_CODECS.get(sock))
         else:
             data = await loop.sock_recv(sock, 0)
         return pickle.loads(data)
 
     async def writer(sock, data):
         serialized = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
-        header = struct.pack("!i", len(serialized))
-        await loop.sock_sendall(sock,  header + serialized)
+        frame = pack_frame(serialized, SOCKET_CODECS.get(sock))
+        await loop.sock_sendall(sock, frame)
+
+    async def session(client, host, port):
+        try:
+            await handler(reader, writer, client, host, port)
+        finally:
+            admission.close_session()
+
+    async def refuse(client, error):
+        # Answer the first request, closing with unread data would reset
+        # the connection before the client reads the error.
+        with client, contextlib.suppress(Exception):
+            header = await asyncio.wait_for(loop.sock_recv(client, 4), 5)
+            if header:
+                await discard(client, abs(*struct.unpack("!i", header)))
+            await writer(client, ServerError(error))
 
     with sock:
         while True:
             client, (host, port) = await loop.sock_accept(sock)
-            loop.create_task(handler(reader, writer, client, host, port))
+            if admission is None:
+                loop.create_task(handler(reader, writer, client, host, port))
+                continue
+            try:
+                admission.open_session()
+            except ServerBusyError as error:
+                loop.create_task(refuse(client, error))
+            else:
+                loop.create_task(session(client, host, port))
 
 
 def require(name):
@@ -95,6 +343,46 @@ class ServerError:
         return f"csqlite.ServerError: {self.error}"
 
 
+class Redirect:
+    """Answer of a supervisor that tells the client to open its
+    connection on the worker at *address*.
+    """
+    def __init__(self, address):
+        self.address = address
+
+    def __repr__(self):
+        return "csqlite.Redirect: %s:%d" % self.address
+
+
+class Partial(list):
+    """Rows of a result whose next rows are fetched by another request.
+    """
+
+
+class HashRing:
+    """Consistent hashing of keys to *nodes*.
+
+    Each node is placed on the ring many times, so keys are spread evenly
+    and adding or removing a node only moves the keys of that node.
+    """
+    def __init__(self, nodes, replicas=100):
+        self.nodes = list(nodes)
+        self.ring = sorted((self.hash("%r-%d" % (node, i)), index)
+                           for index, node in enumerate(self.nodes)
+                           for i in range(replicas))
+        self.hashes = [item[0] for item in self.ring]
+
+    @staticmethod
+    def hash(key):
+        import hashlib
+        digest = hashlib.md5(str(key).encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def __getitem__(self, key):
+        position = bisect.bisect(self.hashes, self.hash(key))
+        return self.nodes[self.ring[position % len(self.ring)][1]]
+
+
 class ServerWarning:
     def __init__(self, warning):
         self.warning = warning
@@ -106,6 +394,8 @@ class ServerWarning:
 class SafeLogger(queue.Queue):
     def __init__(self, name):
         super().__init__()
+        import asyncio
+
         self.log = logging.getLogger(name).log
         self.loop = asyncio.get_event_loop()
 
@@ -133,12 +423,22 @@ class SafeLogger(queue.Queue):
     async def new_server(self):
         while True:
             if self:
-                lvl, msg, args, kwargs = \
-                    await self.loop.run_in_executor(None, self.get)
+                item = await self.loop.run_in_executor(None, self.get)
+                if item is None:
+                    break
+                lvl, msg, args, kwargs = item
                 self.log(lvl, msg, *args, **kwargs)
 
+    def close(self):
+        """Wake up new_server() to end it, the process can't exit while
+        its thread waits for a message.
+        """
+        self.put_nowait(None)
+
 
 def new_progress_server(callback):
+    import socketserver
+
     class CallbackRequestHandler(socketserver.BaseRequestHandler):
         def handle(self):
             self.request.recv(1)
@@ -147,6 +447,8 @@ def new_progress_server(callback):
 
 
 def new_trace_server(trace_callback):
+    import socketserver
+
     class CallbackRequestHandler(socketserver.BaseRequestHandler):
         def handle(self):
             header = self.request.recv(4)
@@ -18,6 +18,20 @@ MODULES = [
     "csqlite3/utils.py",
     "csqlite3/server.py",
     "csqlite3/client.py",
+    "csqlite3/loadgen.py",
+    "csqlite3/profiling.py",
+    "csqlite3/cache.py",
+    "csqlite3/bulk.py",
+    "csqlite3/admin.py",
+    "csqlite3/supervisor.py",
+    "csqlite3/sharding.py",
+    "csqlite3/scheduling.py",
+    "csqlite3/groupcommit.py",
+    "csqlite3/spool.py",
+    "csqlite3/slowlog.py",
+    "csqlite3/advisor.py",
+    "csqlite3/pragmas.py",
+    "csqlite3/memory.py",
 ]
 TIMEOUT = 5
 
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from csqlite3 import advisor
+
+
+class AdvisorSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "advisor.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (id, kind, price)")
+            connection.execute("CREATE TABLE tag (item, name)")
+            connection.executemany("INSERT INTO item VALUES (?, ?, ?)",
+                                   [(i, i % 5, i) for i in range(100)])
+        self.advisor = advisor.Advisor(sample_rate=1)
+
+    def tearDown(self):
+        self.advisor.close()
+        self.directory.cleanup()
+
+    def observe(self, *samples):
+        async def observe():
+            for sample in samples:
+                analysis = self.advisor.observe(*sample)
+                if analysis is not None:
+                    await analysis
+        asyncio.run(observe())
+
+    def analyze(self, sql, parameters=()):
+        return self.advisor.analyze(self.advisor.connection(self.path), sql,
+                                    parameters)
+
+    def test_scan(self):
+        self.assertEqual(
+            self.analyze("SELECT * FROM item WHERE price > ? AND kind = ?",
+                         (1, 2)),
+            [("item", ("kind", "price"))])
+        self.assertEqual(self.analyze("SELECT count(*) FROM item"), [])
+
+    def test_order_by(self):
+        self.assertEqual(
+            self.analyze("SELECT * FROM item i WHERE i.kind = 1 "
+                         "ORDER BY i.price DESC"),
+            [("item", ("kind", "price"))])
+
+    def test_automatic_index(self):
+        missing = self.analyze("SELECT * FROM item JOIN tag "
+                               "ON tag.item = item.id")
+        self.assertIn(("tag", ("item",)), missing)
+
+    def test_advice(self):
+        self.observe(*[(self.path, "SELECT * FROM item WHERE kind = ?",
+                        (1,))] * 3,
+                     (self.path, "SELECT name FROM tag WHERE name = ?",
+                      ("a",)),
+                     (":memory:", "SELECT * FROM t WHERE a = 1"))
+        advice = self.advisor.advice(verify=True)
+        self.assertEqual([candidate["sql"] for candidate in advice], [
+            "CREATE INDEX idx_item_kind ON item (kind)",
+            "CREATE INDEX idx_tag_name ON tag (name)",
+        ])
+        self.assertEqual(advice[0]["benefit"], 300)
+        self.assertTrue(advice[0]["verified"])
+        self.assertEqual(len(self.advisor.advice(top=1)), 1)
+
+    def test_one_copy_per_database(self):
+        copies = []
+        copy = self.advisor.copy
+
+        def record(database, path):
+            copies.append(database)
+            return copy(database, path)
+        self.advisor.copy = record
+        self.observe((self.path, "SELECT * FROM item WHERE kind = ?", (1,)),
+                     (self.path, "SELECT * FROM item WHERE price = ?", (1,)))
+        advice = self.advisor.advice(verify=True)
+        self.assertEqual(copies, [self.path])
+        self.assertEqual([candidate["verified"] for candidate in advice],
+                         [True, True])
+
+    def test_count_limit(self):
+        self.advisor.count_limit = 10
+        self.assertEqual(self.advisor.rows(self.path, "item"), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,15 @@
 import hashlib
 import inspect
+import io
 import itertools
+import os
 import pathlib
 import sqlite3
+import tempfile
 import unittest
 
 import csqlite3
+from csqlite3 import admin
 
 
 # Helpers
@@ -175,6 +179,77 @@ class ConnectionSuite(unittest.TestCase):
         self.cursor.execute("select c from characters")
         self.assertEqual(self.cursor.fetchall(), list(IterChars()))
 
+    def test_prepare(self):
+        self.connection.execute("create table prepared(a, b)")
+        insert = self.connection.prepare("insert into prepared values (?, ?)")
+        select = self.connection.prepare("select b from prepared where a=?")
+        self.assertIsInstance(insert, int)
+        self.connection.execute(insert, (1, "one"))
+        self.cursor.executemany(insert, [(2, "two"), (3, "three")])
+        self.assertEqual(self.cursor.execute(select, (2,)).fetchall(),
+                         [("two",)])
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.cursor.execute(select + 100, (2,))
+        with self.assertRaises(sqlite3.OperationalError):
+            self.connection.prepare("select * from missing_table")
+
+    def test_streaming_executemany(self):
+        self.connection.execute("create table stream(n primary key)")
+        rows = ((n,) for n in range(2500))
+        self.cursor.executemany("insert into stream(n) values (?)", rows)
+        self.assertEqual(self.cursor.rowcount, 2500)
+        self.cursor.execute("select count(*) from stream")
+        self.assertEqual(self.cursor.fetchone(), (2500,))
+
+    def test_streaming_executemany_is_atomic(self):
+        self.connection.execute("create table stream_atomic(n primary key)")
+        rows = itertools.chain(((n,) for n in range(1500)), [(0,)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.cursor.executemany(
+                "insert into stream_atomic(n) values (?)", rows)
+
+        def broken():
+            yield from ((n,) for n in range(1500))
+            raise ValueError("broken generator")
+        with self.assertRaises(ValueError):
+            self.cursor.executemany(
+                "insert into stream_atomic(n) values (?)", broken())
+        self.cursor.execute("select count(*) from stream_atomic")
+        self.assertEqual(self.cursor.fetchone(), (0,))
+
+    def test_bulk_load_stream(self):
+        self.connection.execute("create table bulk_csv(name, age)")
+        self.connection.execute("create index bulk_csv_age on bulk_csv(age)")
+        self.connection.commit()
+        data = "name,age\n" + "".join("p%d,%d\n" % (i, i)
+                                       for i in range(5000))
+        reports = []
+        self.connection.chunksize = 4096
+        report = self.connection.bulk_load(
+            "bulk_csv", io.BytesIO(data.encode()), defer_indexes=True,
+            progress=reports.append)
+        del self.connection.chunksize
+        self.assertEqual(report["rows"], 5000)
+        self.assertTrue(reports)
+        self.cursor.execute("select count(*), max(age) from bulk_csv")
+        self.assertEqual(self.cursor.fetchone(), (5000, "999"))
+        self.cursor.execute("select name from sqlite_master "
+                            "where type='index' and tbl_name='bulk_csv'")
+        self.assertEqual(self.cursor.fetchall(), [("bulk_csv_age",)])
+
+    def test_bulk_load_path(self):
+        self.connection.execute("create table bulk_json(a, b)")
+        self.connection.commit()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "data.ndjson")
+            with open(path, "w") as output:
+                output.write('{"a": 1, "b": "x"}\n{"b": "y", "a": 2}\n')
+            report = self.connection.bulk_load("bulk_json", path,
+                                               format="ndjson")
+        self.assertEqual(report["rows"], 2)
+        self.cursor.execute("select a, b from bulk_json order by a")
+        self.assertEqual(self.cursor.fetchall(), [(1, "x"), (2, "y")])
+
     def test_executescript(self):
         cursor = self.connection.executescript("""
             create table person(
@@ -298,6 +373,33 @@ class ConnectionSuite(unittest.TestCase):
                     'COMMIT;']
         self.assertEqual(obtained, expected)
 
+    def test_iterdump_batches(self):
+        path = str(pathlib.Path("tests")/"iterdump_example.db")
+        con = csqlite3.connect(path)
+        con.dumpsize = 2
+        obtained = list(con.iterdump())
+        con.close()
+        self.assertEqual(len(obtained), 7)
+        self.assertEqual(obtained[-1], "COMMIT;")
+
+    def test_backup(self):
+        con = csqlite3.connect(":memory:")
+        con.execute("create table backup_data(item)")
+        con.executemany("insert into backup_data values (?)",
+                        [(i,) for i in range(100)])
+        con.commit()
+        steps = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "backup.db")
+            con.backup(path, pages=1, sleep=0.001,
+                       progress=lambda *status: steps.append(status))
+            con.close()
+            copy = sqlite3.connect(path)
+            count = copy.execute("select count(*) from backup_data")
+            self.assertEqual(count.fetchone(), (100,))
+            copy.close()
+        self.assertTrue(steps)
+
 
 class CursorSuite(unittest.TestCase):
     @classmethod
@@ -336,6 +438,49 @@ class CursorSuite(unittest.TestCase):
         expected = [(1,), (2,), (3,)]
         self.assertEqual(obtained, expected)
 
+    def test_fetchmany_row_factory(self):
+        self.connection.row_factory = dict_factory
+        try:
+            self.cursor.execute("select 1 as a union all select 2")
+            self.assertEqual(self.cursor.fetchmany(2), [{"a": 1}, {"a": 2}])
+        finally:
+            self.connection.row_factory = None
+
+    def test_lazy_rows(self):
+        self.connection.page_factory = csqlite3.lazy_rows
+        try:
+            self.cursor.execute("select 1 as a, 'x' as B union all "
+                                "select 2, 'y'")
+            rows = self.cursor.fetchall()
+            self.assertEqual(len(rows), 2)
+            self.assertIsInstance(rows[0], csqlite3.LazyRow)
+            self.assertEqual((rows[1]["a"], rows[1]["b"]), (2, "y"))
+            self.assertEqual(rows[0], (1, "x"))
+            self.assertEqual(rows[0].keys(), ["a", "b"])
+            self.assertIs(rows[0]._index, rows[1]._index)
+            self.cursor.execute("select 3 as c")
+            self.assertEqual(self.cursor.fetchone()["c"], 3)
+        finally:
+            self.connection.page_factory = None
+
+    def test_export(self):
+        self.cursor.execute("CREATE TABLE cursor_export (a, b)") \
+                   .executemany("INSERT INTO cursor_export VALUES (?, ?)",
+                                [(i, "x%d" % i) for i in range(2500)])
+        output = io.BytesIO()
+        sql = "SELECT a, b FROM cursor_export ORDER BY a"
+        self.assertEqual(self.cursor.export(sql, output), 2500)
+        lines = output.getvalue().decode().splitlines()
+        self.assertEqual(lines[:2], ["a,b", "0,x0"])
+        self.assertEqual(len(lines), 2501)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "export.ndjson")
+            rows = self.cursor.export(sql + " LIMIT 2", path, "ndjson")
+            self.assertEqual(rows, 2)
+            with open(path) as exported:
+                self.assertEqual(exported.readline(),
+                                 '{"a": 0, "b": "x0"}\n')
+
     def test_rowcount(self):
         self.cursor.execute("CREATE TABLE cursor_4 (p INT)") \
                    .executemany("INSERT INTO cursor_4 (p) VALUES (?)",
@@ -353,5 +498,183 @@ class CursorSuite(unittest.TestCase):
         self.assertEqual(self.cursor.arraysize, 2)
 
 
+class DeadlineSuite(unittest.TestCase):
+    def test_statement_deadline(self):
+        connection = csqlite3.connect(":memory:")
+        try:
+            with self.assertRaises(csqlite3.DeadlineExceededError):
+                connection.execute(
+                    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+                    "SELECT i + 1 FROM n) SELECT count(*) FROM n",
+                    deadline=0.1)
+            self.assertEqual(connection.execute("SELECT 1").fetchall(),
+                             [(1,)])
+        finally:
+            connection.close()
+
+
+class BatchSuite(unittest.TestCase):
+    def setUp(self):
+        self.connection = csqlite3.connect(":memory:")
+        self.connection.execute("create table account(id primary key, n)")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_run_batch(self):
+        select = self.connection.prepare("select n from account where id=?")
+        results = self.connection.run_batch([
+            ("insert into account values (?, ?)", (1, 10)),
+            ("insert into account values (?, ?)", (2, 20)),
+            ("update account set n = n + 1", ()),
+            (select, (2,)),
+        ], fetch=[3])
+        self.assertEqual([result.rowcount for result in results[:3]],
+                         [1, 1, 2])
+        self.assertEqual(results[1].lastrowid, 2)
+        self.assertIsNone(results[0].rows)
+        self.assertEqual(results[3].rows, [(21,)])
+        self.assertFalse(self.connection.in_transaction)
+
+    def test_run_batch_is_atomic(self):
+        statements = [("insert into account values (1, 0)", ()),
+                      ("insert into account values (1, 0)", ())]
+        with self.assertRaises(sqlite3.IntegrityError) as context:
+            self.connection.run_batch(statements)
+        self.assertEqual(context.exception.statement_index, 1)
+        self.assertEqual(context.exception.statement, statements[1][0])
+        rows = self.connection.execute("select * from account").fetchall()
+        self.assertEqual(rows, [])
+
+    def test_failed_batch_ends_its_transaction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "batch.db")
+            first = csqlite3.connect(path)
+            second = csqlite3.connect(path, timeout=0.1)
+            try:
+                first.execute("create table account(id primary key)")
+                first.commit()
+                with self.assertRaises(sqlite3.IntegrityError):
+                    first.run_batch([("insert into account values (1)", ()),
+                                     ("insert into account values (1)", ())])
+                self.assertFalse(first.in_transaction)
+                second.execute("insert into account values (2)")
+                second.commit()
+            finally:
+                first.close()
+                second.close()
+
+
+class WriteBehindSuite(unittest.TestCase):
+    def setUp(self):
+        self.connection = csqlite3.connect(":memory:")
+        self.connection.execute("create table item(id primary key)")
+        self.connection.write_behind = 3
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_writes_are_held_back(self):
+        self.connection.execute("insert into item values (1)")
+        self.connection.execute("insert into item values (2)")
+        self.assertEqual(len(self.connection._socket.pending), 2)
+        self.connection.execute("insert into item values (3)")
+        self.assertEqual(len(self.connection._socket.pending), 0)
+        self.connection.execute("insert into item values (4)")
+        rows = self.connection.execute("select count(*) from item")
+        self.assertEqual(rows.fetchall(), [(4,)])
+        self.connection.execute("insert into item values (5)")
+        self.connection.commit()
+        self.assertFalse(self.connection.in_transaction)
+        rows = self.connection.execute("select count(*) from item")
+        self.assertEqual(rows.fetchall(), [(5,)])
+
+    def test_held_back_writes_have_lastrowid_and_rowcount(self):
+        cursor = self.connection.execute("insert into item values (1)")
+        cursor = self.connection.execute("insert into item values (2)")
+        self.assertEqual(cursor.lastrowid, 2)
+        self.assertEqual(len(self.connection._socket.pending), 0)
+        cursor = self.connection.execute("update item set id = id + 10")
+        self.assertEqual(cursor.rowcount, 2)
+        self.connection.commit()
+
+    def test_errors_name_the_statement(self):
+        self.connection.execute("insert into item values (1)")
+        self.connection.execute("insert into item values (1)")
+        with self.assertRaises(sqlite3.IntegrityError) as context:
+            self.connection.commit()
+        self.assertEqual(context.exception.statement_index, 1)
+        self.connection.rollback()
+
+
+class CompressionSuite(unittest.TestCase):
+    def test_large_results_are_compressed(self):
+        connection = csqlite3.connect(":memory:", compression="zlib")
+        try:
+            rows = connection.execute(
+                "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 "
+                "FROM n LIMIT 1000) SELECT 'csqlite3', i FROM n").fetchall()
+            self.assertEqual(rows[-1], ("csqlite3", 1000))
+            stats = connection.compression_stats()
+            self.assertLess(stats["received_wire"], stats["received_raw"])
+        finally:
+            connection.close()
+
+    def test_no_compression(self):
+        connection = csqlite3.connect(":memory:")
+        self.assertEqual(connection.compression_stats(), {})
+        connection.close()
+
+
+class ProfileSuite(unittest.TestCase):
+    def test_readonly(self):
+        connection = csqlite3.connect(":memory:", profile="readonly")
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                connection.execute("create table item(value)")
+        finally:
+            connection.close()
+
+    def test_unknown_profile(self):
+        with self.assertRaises(sqlite3.ProgrammingError):
+            csqlite3.connect(":memory:", profile="fast")
+
+
+class MemoryDatabaseSuite(unittest.TestCase):
+    def test_named_memory_database_is_shared(self):
+        name = "client_test_%d" % os.getpid()
+        first = csqlite3.connect(":memory:" + name)
+        second = csqlite3.connect(":memory:" + name)
+        try:
+            first.execute("create table item(value)")
+            first.execute("insert into item values (1)")
+            first.commit()
+            rows = second.execute("select * from item").fetchall()
+            self.assertEqual(rows, [(1,)])
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "snapshot.db")
+                self.assertEqual(admin.snapshot(name, path), path)
+                with sqlite3.connect(path) as saved:
+                    rows = saved.execute("select * from item").fetchall()
+                saved.close()
+            self.assertEqual(rows, [(1,)])
+        finally:
+            first.close()
+            second.close()
+            admin.drop_memory(name)
+
+
+class AdminSuite(unittest.TestCase):
+    def test_sampler_profiling(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stacks.txt")
+            admin.start_profiling("sampler", path, interval=0.001)
+            connection = csqlite3.connect(":memory:")
+            connection.execute("select 1").fetchall()
+            connection.close()
+            self.assertEqual(admin.stop_profiling("sampler"), [path])
+            self.assertTrue(os.path.exists(path))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,24 @@
+import os
+import pathlib
 import sqlite3
+import subprocess
+import sys
+import tempfile
 import unittest
 
 import csqlite3
 
 
+IMPORT_CHECK = """
+import logging, sys
+import csqlite3
+heavy = ["asyncio", "configparser", "hashlib", "logging.config",
+         "socketserver", "zlib"]
+print([name for name in heavy if name in sys.modules])
+print(logging.getLogger("Server").handlers)
+"""
+
+
 class ConstantSuite(unittest.TestCase):
     def test_version(self):
         self.assertEqual(csqlite3.version, "1.0b1")
@@ -32,5 +47,19 @@ class ConstantSuite(unittest.TestCase):
         csqlite3.enable_callback_tracebacks(True)
         csqlite3.enable_callback_tracebacks(False)
 
+
+class ImportSuite(unittest.TestCase):
+    def test_import_is_side_effect_free(self):
+        root = str(pathlib.Path(csqlite3.__file__).parent.parent)
+        environment = dict(os.environ, PYTHONPATH=root)
+        with tempfile.TemporaryDirectory() as directory:
+            output = subprocess.run(
+                [sys.executable, "-c", IMPORT_CHECK], cwd=directory,
+                env=environment, check=True, capture_output=True,
+                text=True, timeout=60).stdout
+            self.assertFalse(os.path.exists(os.path.join(directory, "logs")))
+        self.assertEqual(output.splitlines(), ["[]", "[]"])
+
+
 if __name__ == '__main__':
     unittest.main()
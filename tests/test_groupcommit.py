@@ -0,0 +1,51 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from csqlite3 import groupcommit
+
+
+class GroupCommitSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "group.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (value UNIQUE)")
+        self.group_commit = groupcommit.GroupCommit(window=0.01)
+
+    def tearDown(self):
+        self.group_commit.close()
+        self.directory.cleanup()
+
+    def execute(self, *statements):
+        async def run():
+            return await asyncio.gather(*(
+                self.group_commit.execute(self.path, sql, parameters)
+                for sql, parameters in statements), return_exceptions=True)
+        return asyncio.run(run())
+
+    def test_one_commit(self):
+        results = self.execute(*[("INSERT INTO item VALUES (?)", (i,))
+                                 for i in range(10)])
+        self.assertEqual([result.lastrowid for result in results],
+                         list(range(1, 11)))
+        self.assertEqual(self.group_commit.stats["commits"], 1)
+        with sqlite3.connect(self.path) as connection:
+            count = connection.execute("SELECT count(*) FROM item")
+            self.assertEqual(count.fetchone()[0], 10)
+
+    def test_failures_are_isolated(self):
+        results = self.execute(("INSERT INTO item VALUES (1)", ()),
+                               ("INSERT INTO item VALUES (1)", ()),
+                               ("INSERT INTO item VALUES (2)", ()))
+        self.assertIsInstance(results[1], sqlite3.IntegrityError)
+        self.assertEqual(results[2].rowcount, 1)
+        with sqlite3.connect(self.path) as connection:
+            rows = connection.execute("SELECT value FROM item").fetchall()
+            self.assertEqual(rows, [(1,), (2,)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from csqlite3 import loadgen
+
+
+class HistogramSuite(unittest.TestCase):
+    def test_percentile(self):
+        histogram = loadgen.Histogram()
+        for _ in range(99):
+            histogram.record(0.001)
+        histogram.record(1.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.percentile(50), 1.0, delta=0.05)
+        self.assertAlmostEqual(histogram.percentile(99.9), 1000, delta=50)
+
+    def test_merge(self):
+        first, second = loadgen.Histogram(), loadgen.Histogram()
+        first.record(0.5)
+        second.record(0.5)
+        first.merge(second)
+        self.assertEqual(first.count, 2)
+
+
+class ScheduleSuite(unittest.TestCase):
+    def test_fixed_rate(self):
+        offsets = list(loadgen.new_schedule(10, 1))
+        self.assertEqual(len(offsets), 9)
+        self.assertAlmostEqual(offsets[0], 0.1)
+
+    def test_poisson(self):
+        offsets = list(loadgen.new_schedule(1000, 1, poisson=True, seed=1))
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertLess(offsets[-1], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
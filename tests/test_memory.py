@@ -0,0 +1,96 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from csqlite3 import memory
+
+
+class MemoryDatabasesSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "hot.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (value)")
+            connection.execute("INSERT INTO item VALUES (1)")
+        connection.close()
+        self.databases = memory.MemoryDatabases({"hot": {
+            "load": self.path, "snapshot": self.path, "interval": 60}})
+
+    def tearDown(self):
+        self.databases.close()
+        self.directory.cleanup()
+
+    def connect(self, name):
+        return sqlite3.connect(self.databases.open(name), uri=True)
+
+    def test_name_of(self):
+        self.assertEqual(memory.name_of(":memory:hot"), "hot")
+        self.assertIsNone(memory.name_of(":memory:"))
+        self.assertIsNone(memory.name_of("hot.db"))
+
+    def test_shared_and_kept(self):
+        first = self.connect("shared")
+        first.execute("CREATE TABLE item (value)")
+        first.execute("INSERT INTO item VALUES (1)")
+        first.commit()
+        first.close()
+        second = self.connect("shared")
+        self.assertEqual(second.execute("SELECT * FROM item").fetchall(),
+                         [(1,)])
+        second.close()
+        other = self.connect("other")
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute("SELECT * FROM item")
+        other.close()
+
+    def test_warm_and_snapshot(self):
+        self.databases.warm()
+        connection = self.connect("hot")
+        connection.execute("INSERT INTO item VALUES (2)")
+        connection.commit()
+        connection.close()
+        self.databases.save()
+        with sqlite3.connect(self.path) as saved:
+            rows = saved.execute("SELECT value FROM item").fetchall()
+        saved.close()
+        self.assertEqual(rows, [(1,), (2,)])
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_drop(self):
+        connection = self.connect("dropped")
+        connection.execute("CREATE TABLE item (value)")
+        connection.close()
+        self.assertTrue(self.databases.drop("dropped"))
+        self.assertFalse(self.databases.drop("dropped"))
+        connection = self.connect("dropped")
+        connection.execute("CREATE TABLE item (value)")
+        connection.close()
+
+    def test_dropped_database_is_not_saved(self):
+        self.databases.warm()
+        self.databases.drop("hot")
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.databases.snapshot("hot")
+        asyncio.run(asyncio.wait_for(
+            self.databases.save_every("hot", 0.01), 1))
+        self.assertNotIn("hot", self.databases)
+        with sqlite3.connect(self.path) as saved:
+            rows = saved.execute("SELECT value FROM item").fetchall()
+        saved.close()
+        self.assertEqual(rows, [(1,)])
+
+    def test_file_errors_are_logged(self):
+        with open(self.path, "wb") as corrupt:
+            corrupt.write(b"not a database" * 100)
+        with self.assertLogs("Server", "ERROR"):
+            self.databases.warm()
+        self.databases.settings["hot"]["snapshot"] = os.path.join(
+            self.directory.name, "missing", "hot.db")
+        with self.assertLogs("Server", "ERROR"):
+            self.databases.save()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import configparser
+import sqlite3
+import unittest
+
+from csqlite3 import pragmas
+
+
+class ProfilesSuite(unittest.TestCase):
+    def setUp(self):
+        config = configparser.ConfigParser()
+        config.read_string("""
+            [profiles]
+            /srv/reports/*.db=analytics
+            /srv/app.db=small
+
+            [profile:small]
+            cache_size=-1024
+
+            [profile:oltp]
+            synchronous=FULL
+        """)
+        self.profiles = pragmas.Profiles.from_config(config)
+
+    def test_profile_of_database(self):
+        self.assertEqual(self.profiles.profile(None, "/srv/reports/q1.db"),
+                         "analytics")
+        self.assertEqual(self.profiles.profile(None, "/srv/app.db"), "small")
+        self.assertEqual(self.profiles.profile("oltp", "/srv/app.db"),
+                         "oltp")
+        self.assertIsNone(self.profiles.profile(None, ":memory:"))
+        with self.assertRaises(sqlite3.ProgrammingError):
+            self.profiles.profile("fast", ":memory:")
+
+    def test_config_changes_profiles(self):
+        self.assertEqual(self.profiles["small"], {"cache_size": "-1024"})
+        self.assertEqual(self.profiles["oltp"]["synchronous"], "FULL")
+        self.assertEqual(self.profiles["oltp"]["journal_mode"], "WAL")
+        self.assertEqual(pragmas.PROFILES["oltp"]["synchronous"], "NORMAL")
+
+    def test_apply(self):
+        connection = sqlite3.connect(":memory:")
+        self.assertIsNone(self.profiles.apply(connection, "readonly"))
+        with self.assertRaises(sqlite3.OperationalError):
+            connection.execute("CREATE TABLE item (value)")
+        previous = self.profiles.apply(connection, "bulk_load")
+        self.assertEqual(previous["synchronous"], 2)
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import asyncio
+import sqlite3
+import unittest
+
+from csqlite3 import scheduling
+
+
+async def request(scheduler, order, client, priority, work=0):
+    async with scheduler.turn("main.db", client, priority):
+        order.append(client)
+        await asyncio.sleep(work)
+
+
+class SchedulerSuite(unittest.TestCase):
+    def run_requests(self, scheduler, requests):
+        order = []
+
+        async def run():
+            # The first request holds the database while the others queue.
+            await asyncio.gather(*(request(scheduler, order, *arguments)
+                                   for arguments in requests))
+        asyncio.run(run())
+        return order
+
+    def test_interactive_goes_first(self):
+        scheduler = scheduling.Scheduler()
+        order = self.run_requests(scheduler, [
+            ("first", "normal", 0.01),
+            ("batch", "batch"),
+            ("user", "interactive"),
+        ])
+        self.assertEqual(order, ["first", "user", "batch"])
+        self.assertFalse(scheduler.busy)
+
+    def test_weighted_fair_share(self):
+        scheduler = scheduling.Scheduler(batch_share=1)
+        requests = [("first", "normal", 0.01)]
+        requests += [("batch", "batch")] * 4 + [("user", "interactive")] * 4
+        order = self.run_requests(scheduler, requests)
+        # Interactive requests are worth 1/8 of virtual time, batch 1.
+        self.assertEqual(order[1:5], ["user"] * 4)
+
+    def test_batch_share_cap(self):
+        scheduler = scheduling.Scheduler(batch_share=0.5)
+        scheduler.usage["main.db"].extend([("batch", 1.0), ("normal", 0.1)])
+        scheduler.finish["main.db", "user"] = 10
+        order = self.run_requests(scheduler, [
+            ("first", "normal", 0.01),
+            ("batch", "batch"),
+            ("user", "normal"),
+        ])
+        self.assertEqual(order, ["first", "user", "batch"])
+
+    def test_unknown_priority(self):
+        with self.assertRaises(sqlite3.ProgrammingError):
+            scheduling.check("urgent")
+        scheduling.check("urgent", {"urgent": 16})
+
+
+if __name__ == '__main__':
+    unittest.main()
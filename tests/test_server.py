@@ -1,8 +1,20 @@
+import asyncio
+import os
+import pstats
 import sqlite3
+import tempfile
+import threading
 import unittest
 
+from csqlite3 import advisor
+from csqlite3 import cache
+from csqlite3 import groupcommit
 from csqlite3 import utils
+from csqlite3 import scheduling
 from csqlite3 import server
+from csqlite3 import slowlog
+from csqlite3 import spool
+from csqlite3 import supervisor
 
 
 LOG_PATH = utils.BASE.parent/"logs"/"server.log"
@@ -51,6 +63,18 @@ class DatabaseSuite(unittest.TestCase):
         database[KEY]
         self.assertIn(KEY, database)
 
+    def test_admin_request_ends_the_session(self):
+        database = server.Database()
+        answers = []
+
+        async def writer(client, message):
+            answers.append(message)
+        status = asyncio.run(database.handle_request(
+            writer, None, *KEY, "admin", "cache_stats", ()))
+        self.assertIs(status, StopIteration)
+        self.assertEqual(answers, [{}])
+        self.assertNotIn(KEY, database)
+
 
 class ObjectDispatcherSuite(unittest.TestCase):
     def test_object_dispatcher_creation(self):
@@ -79,6 +103,109 @@ class ConnectionDispatcher(unittest.TestCase):
                               sqlite3.Connection)
 
 
+class ProfileSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.database = server.Database()
+        self.connection = self.database[KEY]["connection"]
+
+    def tearDown(self):
+        self.connection["close"]()
+        self.directory.cleanup()
+
+    def pragma(self, name):
+        return self.connection.connection.execute(
+            "PRAGMA %s" % name).fetchone()[0]
+
+    def test_oltp(self):
+        self.connection["open"](
+            database=os.path.join(self.directory.name, "oltp.db"),
+            profile="oltp")
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        self.assertEqual(self.pragma("busy_timeout"), 5000)
+
+    def test_bulk_load_ends_at_commit(self):
+        self.connection["open"](database=":memory:", profile="bulk_load")
+        self.assertEqual(self.pragma("synchronous"), 0)
+        self.connection.connection.execute("CREATE TABLE item (value)")
+        self.connection["commit"]()
+        self.assertEqual(self.pragma("synchronous"), 2)
+        self.assertEqual(self.pragma("cache_size"), -2000)
+
+    def test_bulk_load_ends_after_an_autocommit_write(self):
+        self.connection["open"](database=":memory:", profile="bulk_load",
+                                isolation_level=None)
+        self.database[KEY]["cursor"]["open"]()
+
+        async def writer(client, message):
+            pass
+
+        async def execute(sql):
+            await self.database.handle_request(
+                writer, None, *KEY, "cursor", "execute", [sql])
+        asyncio.run(execute("CREATE TABLE item (value)"))
+        self.assertEqual(self.pragma("synchronous"), 0)
+        asyncio.run(execute("INSERT INTO item VALUES (1)"))
+        self.assertEqual(self.pragma("synchronous"), 2)
+
+
+class MemoryDatabaseSuite(unittest.TestCase):
+    def setUp(self):
+        self.database = server.Database()
+        self.keys = [KEY, KEY[:2] + ("12457",)]
+        for key in self.keys:
+            self.database[key]["connection"]["open"](database=":memory:hot")
+
+    def tearDown(self):
+        for key in self.keys:
+            self.database[key]["connection"]["close"]()
+        server.memory_databases.pop("hot").close()
+
+    def test_clients_share_the_database(self):
+        first, second = (self.database[key]["connection"].connection
+                         for key in self.keys)
+        first.execute("CREATE TABLE item (value)")
+        first.execute("INSERT INTO item VALUES (1)")
+        first.commit()
+        self.assertEqual(second.execute("SELECT * FROM item").fetchall(),
+                         [(1,)])
+
+
+class DeadlineSuite(unittest.TestCase):
+    RUNAWAY = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+               "SELECT i + 1 FROM n) SELECT count(*) FROM n")
+
+    def setUp(self):
+        self.database = server.Database()
+        self.database[KEY]["connection"]["open"](database=":memory:")
+        self.database[KEY]["cursor"]["open"]()
+        self.cursor = self.database[KEY]["cursor"]
+
+    def tearDown(self):
+        self.database[KEY]["connection"]["close"]()
+
+    def test_runaway_statement(self):
+        with self.assertRaises(utils.DeadlineExceededError):
+            self.cursor["execute"](self.RUNAWAY, (), 0.05)
+        self.cursor["execute"]("SELECT 1", ())
+        self.assertEqual(self.cursor["fetchall"](), [(1,)])
+
+    def test_default_deadline(self):
+        self.database[KEY]["connection"]["set_deadline"](0.05)
+        with self.assertRaises(utils.DeadlineExceededError):
+            self.cursor["execute"](self.RUNAWAY, ())
+
+    def test_client_progress_handler_still_runs(self):
+        calls = []
+        deadline = self.database[KEY]["connection"].deadline
+        deadline.set_handler(lambda: calls.append(1) or 0, 10)
+        self.cursor["execute"]("SELECT count(*) FROM (WITH RECURSIVE "
+                               "n(i) AS (SELECT 1 UNION ALL SELECT i + 1 "
+                               "FROM n LIMIT 10000) SELECT i FROM n)",
+                               (), 5)
+        self.assertTrue(calls)
+
+
 class ModuleDispatcher(unittest.TestCase):
     def test_dispatcher_instance(self):
         database = server.Database()
@@ -99,6 +226,490 @@ class ModuleDispatcher(unittest.TestCase):
         function(True)
 
 
+class ResultBuffersSuite(unittest.TestCase):
+    def setUp(self):
+        self.previous = server.result_buffers
+        server.result_buffers = spool.ResultBuffers(session_bytes=1024,
+                                                    slice_bytes=4096)
+        self.database = server.Database()
+        self.database[KEY]["connection"]["open"](database=":memory:")
+        self.database[KEY]["cursor"]["open"]()
+        self.cursor = self.database[KEY]["cursor"]
+
+    def tearDown(self):
+        self.database[KEY]["connection"]["close"]()
+        server.result_buffers = self.previous
+
+    def test_spilled_result_is_sent_in_slices(self):
+        self.cursor["execute"]("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+                               "SELECT i + 1 FROM n LIMIT 5000) "
+                               "SELECT i FROM n")
+        rows = self.cursor["fetchall"]()
+        self.assertIsInstance(rows, utils.Partial)
+        result = list(rows)
+        while isinstance(rows, utils.Partial):
+            rows = self.cursor["fetchall"]()
+            result.extend(rows)
+        self.assertEqual(result, [(i,) for i in range(1, 5001)])
+
+    def test_small_result_is_buffered(self):
+        self.cursor["execute"]("SELECT 1")
+        self.assertEqual(self.cursor["fetchall"](), [(1,)])
+        self.assertGreater(server.result_buffers.sessions[KEY], 0)
+
+    def test_cached_read_is_spilled_and_not_cached(self):
+        previous = server.result_cache
+        server.result_cache = cache.ResultCache()
+        key = KEY[:2] + ("12457",)
+        with tempfile.TemporaryDirectory() as directory:
+            self.database[key]["connection"]["open"](
+                database=os.path.join(directory, "spool.db"),
+                check_same_thread=False)
+            self.database[key]["cursor"]["open"]()
+            cursor = self.database[key]["cursor"]
+            try:
+                asyncio.run(cursor["execute"](
+                    "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+                    "SELECT i + 1 FROM n LIMIT 5000) SELECT i FROM n"))
+                self.assertEqual(cursor["fetchone"](), (1,))
+                rows = cursor["fetchall"]()
+                self.assertIsInstance(rows, utils.Partial)
+                result = list(rows)
+                while isinstance(rows, utils.Partial):
+                    rows = cursor["fetchall"]()
+                    result.extend(rows)
+                self.assertEqual(result, [(i,) for i in range(2, 5001)])
+                self.assertEqual(server.result_cache.size, 0)
+                self.assertEqual(server.result_buffers.used, 0)
+            finally:
+                self.database[key]["connection"]["close"]()
+                server.data_versions.close()
+                server.result_cache = previous
+
+    def test_cacheable_reads_hold_their_budget_until_fetched(self):
+        previous = server.result_cache
+        server.result_cache = cache.ResultCache(max_bytes=1024)
+        server.result_buffers = spool.ResultBuffers(
+            session_bytes=96 * 1024, total_bytes=96 * 1024,
+            slice_bytes=4096)
+        keys = [KEY[:2] + (str(pid),) for pid in range(3)]
+        answers = {}
+
+        async def request(key, method, arguments=()):
+            async def writer(client, message):
+                answers[key] = message
+            await self.database.handle_request(writer, None, *key,
+                                               "cursor", method, arguments)
+            # Like Database.handler once the response is written.
+            server.result_buffers.release(key)
+
+        async def execute():
+            await asyncio.gather(*(
+                request(key, "execute",
+                        ["WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+                         "SELECT i + 1 FROM n LIMIT 1000) "
+                         "SELECT printf('%050d', i) FROM n"])
+                for key in keys))
+
+        async def fetchall(key):
+            rows = []
+            while True:
+                await request(key, "fetchall")
+                rows.extend(answers[key])
+                if not isinstance(answers[key], utils.Partial):
+                    return rows
+        with tempfile.TemporaryDirectory() as directory:
+            for key in keys:
+                self.database[key]["connection"]["open"](
+                    database=os.path.join(directory, "held.db"),
+                    check_same_thread=False)
+                self.database[key]["cursor"]["open"]()
+            try:
+                asyncio.run(execute())
+                used = server.result_buffers.used
+                self.assertGreater(used, 0)
+                self.assertLessEqual(used, 96 * 1024)
+                self.assertGreater(server.result_buffers.stats["spilled"],
+                                   0)
+                for key in keys:
+                    self.assertEqual(len(asyncio.run(fetchall(key))), 1000)
+                self.assertEqual(server.result_buffers.used, 0)
+            finally:
+                for key in keys:
+                    self.database[key]["connection"]["close"]()
+                server.data_versions.close()
+                server.result_cache = previous
+
+
+class GroupCommitSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "group.db")
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE parent (id PRIMARY KEY)")
+            connection.execute("CREATE TABLE child "
+                               "(parent REFERENCES parent (id))")
+        self.previous = server.group_commit
+        server.group_commit = groupcommit.GroupCommit(window=0.01)
+        self.database = server.Database()
+        self.database[KEY]["connection"]["open"](
+            database=path, isolation_level=None, check_same_thread=False)
+        self.database[KEY]["cursor"]["open"]()
+        self.cursor = self.database[KEY]["cursor"]
+
+    def tearDown(self):
+        self.database[KEY]["connection"]["close"]()
+        server.group_commit.close()
+        server.group_commit = self.previous
+        self.directory.cleanup()
+
+    def test_writes_are_grouped(self):
+        asyncio.run(self.cursor["execute"]("INSERT INTO parent VALUES (1)"))
+        self.assertEqual(server.group_commit.stats["statements"], 1)
+
+    def test_foreign_keys_of_the_connection_are_enforced(self):
+        self.cursor["execute"]("PRAGMA foreign_keys = ON")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.cursor["execute"]("INSERT INTO child VALUES (1)")
+        self.assertEqual(server.group_commit.stats["statements"], 0)
+
+    def test_profiles_are_applied(self):
+        key = KEY[:2] + ("12457",)
+        self.database[key]["connection"]["open"](
+            database=self.database[KEY]["connection"].database,
+            isolation_level=None, check_same_thread=False,
+            profile="readonly")
+        self.database[key]["cursor"]["open"]()
+        try:
+            with self.assertRaises(sqlite3.OperationalError):
+                self.database[key]["cursor"]["execute"](
+                    "INSERT INTO parent VALUES (1)")
+        finally:
+            self.database[key]["connection"]["close"]()
+
+
+class SlowLogSuite(unittest.TestCase):
+    def setUp(self):
+        self.previous = server.slow_log
+        server.slow_log = slowlog.SlowLog(threshold=10)
+        self.database = server.Database()
+        self.database[KEY]["connection"]["open"](database=":memory:")
+        self.database[KEY]["cursor"]["open"]()
+        self.cursor = self.database[KEY]["cursor"]
+
+    def tearDown(self):
+        self.database[KEY]["connection"]["close"]()
+        server.slow_log = self.previous
+
+    def test_statements_are_timed_to_the_end_of_their_rows(self):
+        for limit in (3, 5):
+            self.cursor["execute"]("WITH RECURSIVE n(i) AS (SELECT 1 UNION "
+                                   "ALL SELECT i + 1 FROM n LIMIT %d) "
+                                   "SELECT i FROM n" % limit)
+            self.cursor["fetchone"]()
+            self.cursor["fetchall"]()
+        self.cursor["execute"]("SELECT 1")
+        self.cursor["close"]()
+        report = self.database[KEY]["admin"]["query_stats"]()
+        stats = report["WITH RECURSIVE n(i) AS (SELECT ? UNION ALL SELECT "
+                       "i + ? FROM n LIMIT ?) SELECT i FROM n"]
+        self.assertEqual((stats["calls"], stats["rows"]), (2, 8))
+        self.assertGreater(stats["total"], 0)
+        self.assertEqual(report["SELECT ?"]["calls"], 1)
+
+
+class IndexAdvisorSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "advisor.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (kind)")
+        self.previous = server.index_advisor
+        server.index_advisor = advisor.Advisor(sample_rate=1)
+        self.database = server.Database()
+        self.database[KEY]["connection"]["open"](database=self.path)
+
+    def tearDown(self):
+        self.database[KEY]["connection"]["close"]()
+        server.index_advisor.close()
+        server.index_advisor = self.previous
+        self.directory.cleanup()
+
+    def test_prepared_statements_are_observed(self):
+        handle = self.database[KEY]["connection"]["prepare"](
+            "SELECT * FROM item WHERE kind = ?")
+
+        async def advice():
+            await self.database.advise(*KEY, "execute_prepared",
+                                       [handle, (1,)])
+            return await self.database[KEY]["admin"]["index_advice"]()
+        self.assertEqual([candidate["sql"] for candidate in
+                          asyncio.run(advice())],
+                         ["CREATE INDEX idx_item_kind ON item (kind)"])
+
+
+class ResultCacheSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (value)")
+            connection.execute("INSERT INTO item VALUES (1)")
+        self.previous = server.result_cache
+        server.result_cache = cache.ResultCache(max_bytes=1024, ttl=60)
+        self.database = server.Database()
+        self.database[KEY]["connection"]["open"](
+            database=self.path, check_same_thread=False)
+        self.database[KEY]["cursor"]["open"]()
+        self.cursor = self.database[KEY]["cursor"]
+
+    def tearDown(self):
+        self.database[KEY]["connection"]["close"]()
+        server.data_versions.close()
+        server.result_cache = self.previous
+        self.directory.cleanup()
+
+    def select(self, sql="SELECT value FROM item ORDER BY value"):
+        asyncio.run(self.cursor["execute"](sql))
+        return self.cursor["fetchall"]()
+
+    def test_hit(self):
+        self.assertEqual(self.select(), [(1,)])
+        self.assertEqual(self.select(), [(1,)])
+        self.assertEqual(server.result_cache.stats["hits"], 1)
+        self.assertEqual(self.cursor["_get_attribute"]("description")[0][0],
+                         "value")
+
+    def test_invalidation(self):
+        self.select()
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("INSERT INTO item VALUES (2)")
+        self.assertEqual(self.select(), [(1,), (2,)])
+        self.assertEqual(server.result_cache.stats["hits"], 0)
+
+    def test_memory_budget(self):
+        self.select("SELECT zeroblob(2048)")
+        self.assertEqual(server.result_cache.size, 0)
+
+    def test_data_version_is_read_off_the_loop(self):
+        threads = []
+        generation = server.data_versions.generation
+
+        def record(database):
+            threads.append(threading.current_thread())
+            return generation(database)
+        server.data_versions.generation = record
+        try:
+            self.select()
+        finally:
+            del server.data_versions.generation
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_temp_tables_are_not_shared(self):
+        key = KEY[:2] + ("12457",)
+        self.database[key]["connection"]["open"](
+            database=self.path, check_same_thread=False)
+        self.database[key]["cursor"]["open"]()
+        cursors = self.cursor, self.database[key]["cursor"]
+        try:
+            for cursor, value in zip(cursors, ("A-private", "B-private")):
+                cursor["executescript"]("CREATE TEMP TABLE item (value); "
+                                        "INSERT INTO item VALUES ('%s')"
+                                        % value)
+            for cursor, value in zip(cursors, ("A-private", "B-private")):
+                result = cursor["execute"]("SELECT value FROM item")
+                if asyncio.iscoroutine(result):
+                    asyncio.run(result)
+                self.assertEqual(cursor["fetchall"](), [(value,)])
+        finally:
+            self.database[key]["connection"]["close"]()
+        self.assertEqual(server.result_cache.size, 0)
+
+    def test_deterministic_read(self):
+        self.assertTrue(cache.is_deterministic_read("select * from t"))
+        self.assertFalse(cache.is_deterministic_read("select random()"))
+        self.assertFalse(cache.is_deterministic_read(
+            "with x as (select 1) insert into t select * from x"))
+        self.assertFalse(cache.is_deterministic_read("delete from t"))
+
+
+class SingleFlightSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "flight.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (value)")
+            connection.execute("INSERT INTO item VALUES (1)")
+        self.previous = server.single_flight
+        server.single_flight = cache.SingleFlight()
+        self.database = server.Database()
+        self.keys = [("127.0.0.1", port, "12456") for port in (1, 2)]
+        for key in self.keys:
+            self.database[key]["connection"]["open"](
+                database=self.path, check_same_thread=False)
+            self.database[key]["cursor"]["open"]()
+
+    def tearDown(self):
+        for key in self.keys:
+            self.database[key]["connection"]["close"]()
+        server.data_versions.close()
+        server.single_flight = self.previous
+        self.directory.cleanup()
+
+    def test_identical_reads_run_once(self):
+        cursors = [self.database[key]["cursor"] for key in self.keys]
+
+        async def run():
+            await asyncio.gather(*(
+                cursor["execute"]("SELECT value FROM item")
+                for cursor in cursors))
+        asyncio.run(run())
+        for cursor in cursors:
+            self.assertEqual(cursor["fetchall"](), [(1,)])
+        self.assertEqual(server.single_flight.stats["executed"], 1)
+        self.assertEqual(server.single_flight.stats["shared"], 1)
+
+    def test_errors_are_shared(self):
+        def function():
+            raise sqlite3.OperationalError("boom")
+
+        async def run():
+            flight = server.single_flight
+            return await asyncio.gather(flight.run("key", function),
+                                        flight.run("key", function),
+                                        return_exceptions=True)
+        errors = asyncio.run(run())
+        self.assertTrue(all(isinstance(error, sqlite3.OperationalError)
+                            for error in errors))
+        self.assertNotIn("key", server.single_flight)
+
+
+class SchedulerSuite(unittest.TestCase):
+    PRIORITIES = {"first": "batch", "batch": "batch", "user": "interactive"}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "scheduler.db")
+        self.previous = server.scheduler
+        server.scheduler = scheduling.Scheduler()
+        self.database = server.Database()
+        self.keys = {name: ("127.0.0.1", port, "12456")
+                     for port, name in enumerate(self.PRIORITIES, 1)}
+        for name, key in self.keys.items():
+            self.database[key]["connection"]["open"](
+                database=path, check_same_thread=False,
+                priority=self.PRIORITIES[name])
+            self.database[key]["cursor"]["open"]()
+
+    def tearDown(self):
+        for key in self.keys.values():
+            self.database[key]["connection"]["close"]()
+        server.scheduler = self.previous
+        self.directory.cleanup()
+
+    def test_plain_executes_wait_for_their_turn(self):
+        answered = []
+
+        async def request(name, sql):
+            async def writer(client, message):
+                answered.append(name)
+            await self.database.handle_request(
+                writer, None, *self.keys[name], "cursor", "execute", [sql])
+
+        async def run():
+            first = asyncio.ensure_future(request(
+                "first", "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL "
+                "SELECT i + 1 FROM n LIMIT 1000000) SELECT count(*) FROM n"))
+            await asyncio.sleep(0)
+            # The statement of the first request runs in the executor, so
+            # these requests arrive while it holds the database.
+            await asyncio.gather(first, request("batch", "SELECT 1"),
+                                 request("user", "SELECT 1"))
+        asyncio.run(run())
+        self.assertEqual(answered, ["first", "user", "batch"])
+        self.assertFalse(server.scheduler.busy)
+
+
+class AdminDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.database = server.Database()
+        self.admin = self.database[KEY]["admin"]
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_cprofile(self):
+        path = os.path.join(self.directory.name, "server.prof")
+        self.admin["start_profiling"](kind="cprofile", path=path)
+        sum(range(1000))
+        self.assertEqual(self.admin["stop_profiling"](kind="cprofile"),
+                         [path])
+        self.assertTrue(pstats.Stats(path).total_calls)
+
+    def test_tracemalloc(self):
+        path = os.path.join(self.directory.name, "allocations.txt")
+        self.admin["start_profiling"](kind="tracemalloc", path=path)
+        data = [str(i) for i in range(1000)]
+        self.admin["stop_profiling"]()
+        with open(path) as report:
+            self.assertIn("Total allocated size", report.readline())
+        del data
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            self.admin["start_profiling"](kind="unknown", path="")
+
+
+class SupervisorSuite(unittest.TestCase):
+    def setUp(self):
+        addresses = [("127.0.0.1", port) for port in (1, 2, 3)]
+        self.supervisor = supervisor.Supervisor(addresses)
+
+    def open(self, pid, **arguments):
+        request = self.supervisor.handle_request(pid, "connection", "open",
+                                                 arguments)
+        return asyncio.run(request)
+
+    def test_route_by_resolved_path(self):
+        path = os.path.abspath("route.db")
+        first = self.open(1, database="route.db")
+        second = self.open(2, database=path)
+        third = self.open(3, database="file:%s?mode=ro" % path, uri=True)
+        self.assertIsInstance(first, utils.Redirect)
+        self.assertEqual(first.address, second.address)
+        self.assertEqual(first.address, third.address)
+
+    def test_route_named_memory_database(self):
+        first = self.open(1, database=":memory:hot")
+        second = self.open(2, database=":memory:hot")
+        self.assertEqual(first.address, second.address)
+
+    def test_admin_paths_of_workers(self):
+        requests = []
+
+        def forward(address, request):
+            requests.append((address, request))
+        self.addCleanup(setattr, supervisor, "forward", supervisor.forward)
+        supervisor.forward = forward
+        asyncio.run(self.supervisor.handle_request(
+            1, "admin", "start_profiling",
+            {"kind": "cprofile", "path": "server.prof", "duration": None}))
+        self.assertEqual(sorted(request[3]["path"]
+                                for _, request in requests),
+                         ["server.prof.1", "server.prof.2", "server.prof.3"])
+        del requests[:]
+        asyncio.run(self.supervisor.handle_request(
+            1, "admin", "snapshot", {"name": "hot", "path": "hot.db"}))
+        self.assertEqual([address for address, _ in requests],
+                         [self.open(2, database=":memory:hot").address])
+
+    def test_cursor_requests_are_refused(self):
+        answer = asyncio.run(self.supervisor.handle_request(
+            1, "cursor", "execute", ["SELECT 1"]))
+        self.assertIsInstance(answer.error, sqlite3.ProgrammingError)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,68 @@
+import concurrent.futures
+import os
+import tempfile
+import unittest
+
+from csqlite3 import sharding
+from csqlite3 import utils
+
+
+class StrategySuite(unittest.TestCase):
+    def test_hash_strategy(self):
+        shards = [(("127.0.0.1", 1), "a.db"), (("127.0.0.1", 2), "b.db")]
+        strategy = sharding.HashStrategy(shards)
+        owners = {strategy(key) for key in range(100)}
+        self.assertEqual(owners, set(strategy.shards))
+        self.assertEqual(strategy(7), strategy(7))
+
+    def test_mapping_strategy(self):
+        default = (("127.0.0.1", 1), "default.db")
+        strategy = sharding.MappingStrategy(
+            {"acme": (("127.0.0.1", 2), "acme.db")}, default)
+        self.assertEqual(strategy("acme").database, "acme.db")
+        self.assertEqual(strategy("other").database, "default.db")
+        self.assertEqual(len(strategy.shards), 2)
+        with self.assertRaises(KeyError):
+            sharding.MappingStrategy({})("acme")
+
+
+class RouterSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        address = (utils.HOST, utils.PORT)
+        shards = [(address, os.path.join(self.directory.name, "%d.db" % i))
+                  for i in range(3)]
+        self.router = sharding.Router(sharding.HashStrategy(shards))
+        for shard in self.router.strategy.shards:
+            self.router.connection(shard).execute(
+                "CREATE TABLE item (tenant, value)")
+
+    def tearDown(self):
+        self.router.close()
+        self.directory.cleanup()
+
+    def test_connections_are_reused(self):
+        self.assertIs(self.router.connect(1), self.router.connect(1))
+        self.assertEqual(len(self.router.connections), 3)
+
+    def test_scatter_gather(self):
+        for tenant in range(30):
+            self.router.execute(tenant, "INSERT INTO item VALUES (?, ?)",
+                                (tenant, tenant * 2))
+        self.router.commit()
+        rows = self.router.scatter(
+            "SELECT tenant FROM item ORDER BY tenant", key=lambda row: row[0])
+        self.assertEqual(rows, [(tenant,) for tenant in range(30)])
+        counts = self.router.scatter("SELECT count(*) FROM item")
+        self.assertEqual(sum(count for count, in counts), 30)
+
+    def test_concurrent_executes(self):
+        def select(tenant):
+            return self.router.execute(tenant, "SELECT ?", (tenant,))
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            rows = list(executor.map(select, range(200)))
+        self.assertEqual(rows, [[(tenant,)] for tenant in range(200)])
+
+
+if __name__ == '__main__':
+    unittest.main()
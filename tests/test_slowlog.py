@@ -0,0 +1,78 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from csqlite3 import slowlog
+
+
+class NormalizeSuite(unittest.TestCase):
+    def test_literals(self):
+        self.assertEqual(
+            slowlog.normalize("SELECT * FROM t1\n WHERE a = 'it''s' "
+                              "AND b > 1.5e3 AND c = x'ff' AND d = ?2"),
+            "SELECT * FROM t1 WHERE a = ? AND b > ? AND c = ? AND d = ?2")
+
+    def test_lists(self):
+        self.assertEqual(slowlog.normalize("SELECT 1 WHERE a IN (1, 2, 3)"),
+                         slowlog.normalize("SELECT 2 WHERE a IN (?,?)"))
+
+    def test_shape(self):
+        self.assertEqual(slowlog.shape((1, "a", None)),
+                         ["int", "str", "NoneType"])
+        self.assertEqual(slowlog.shape({"b": b"", "a": 1.0}),
+                         {"a": "float", "b": "bytes"})
+
+
+class SlowLogSuite(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "slow.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute("CREATE TABLE item (value)")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def statement(self, sql, duration, rows=0):
+        statement = slowlog.Statement(self.path, sql, (1,))
+        statement.add(duration, [()] * rows)
+        return statement
+
+    def test_slow_statement_is_logged(self):
+        log = slowlog.SlowLog(threshold=0.5)
+
+        async def record():
+            self.assertIsNone(log.record(self.statement(
+                "SELECT * FROM item", 0.1)))
+            await log.record(self.statement(
+                "SELECT * FROM item WHERE value = ?", 1.0, 3))
+        asyncio.run(record())
+        log.close()
+        _, message, _, _ = slowlog.logger.get_nowait()
+        self.assertTrue(slowlog.logger.empty())
+        entry = json.loads(message)
+        self.assertEqual(entry["parameters"], ["int"])
+        self.assertEqual(entry["rows"], 3)
+        self.assertIn("SCAN", entry["plan"][0])
+
+    def test_report(self):
+        log = slowlog.SlowLog(threshold=10)
+        for duration in (0.1, 0.3):
+            log.record(self.statement("SELECT %s FROM item" % duration,
+                                      duration, 2))
+        log.record(self.statement("DELETE FROM item", 0.3))
+        report = log.report()
+        self.assertEqual(list(report), ["SELECT ? FROM item",
+                                        "DELETE FROM item"])
+        stats = report["SELECT ? FROM item"]
+        self.assertEqual((stats["calls"], stats["rows"], stats["slow"]),
+                         (2, 4, 0))
+        self.assertAlmostEqual(stats["mean"], 0.2)
+        self.assertEqual(list(log.report(1)), ["SELECT ? FROM item"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import sqlite3
+import unittest
+
+from csqlite3 import spool
+from csqlite3 import utils
+
+
+QUERY = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n "
+         "LIMIT 1000) SELECT i, 'row' FROM n")
+ROWS = [(i, "row") for i in range(1, 1001)]
+
+
+class ResultBuffersSuite(unittest.TestCase):
+    def setUp(self):
+        self.connection = sqlite3.connect(":memory:")
+
+    def tearDown(self):
+        self.connection.close()
+
+    def test_buffered_in_memory(self):
+        buffers = spool.ResultBuffers()
+        rows = buffers.collect("session", self.connection.execute(QUERY))
+        self.assertEqual(rows, ROWS)
+        self.assertGreater(buffers.used, 0)
+        buffers.release("session")
+        self.assertEqual(buffers.used, 0)
+
+    def test_spilled_to_disk(self):
+        buffers = spool.ResultBuffers(session_bytes=1024, slice_bytes=2048,
+                                      chunk_rows=100)
+        result = buffers.collect("session", self.connection.execute(QUERY))
+        self.assertIsInstance(result, spool.Spool)
+        self.assertEqual(buffers.used, 0)
+        slices = []
+        while not result.done:
+            slices.append(result.next_slice())
+        result.close()
+        self.assertGreater(len(slices), 1)
+        self.assertEqual(sum(slices, []), ROWS)
+
+    def test_spooled_rows(self):
+        buffers = spool.ResultBuffers(session_bytes=1024, slice_bytes=2048,
+                                      chunk_rows=100)
+        rows = spool.SpooledRows(
+            buffers.collect("session", self.connection.execute(QUERY)), None)
+        self.assertEqual(rows.fetchone(), ROWS[0])
+        self.assertEqual(rows.fetchmany(2), ROWS[1:3])
+        part = rows.fetchall()
+        self.assertIsInstance(part, utils.Partial)
+        result = list(part)
+        while isinstance(part, utils.Partial):
+            part = rows.fetchall()
+            result.extend(part)
+        rows.close()
+        self.assertEqual(result, ROWS[3:])
+
+    def test_total_budget(self):
+        buffers = spool.ResultBuffers(total_bytes=4096)
+        self.assertTrue(buffers.reserve("first", 4000))
+        self.assertFalse(buffers.reserve("second", 100))
+        buffers.release("first")
+        self.assertTrue(buffers.reserve("second", 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
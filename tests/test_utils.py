@@ -1,5 +1,7 @@
+import asyncio
 import pickle
 import socket
+import sqlite3
 import struct
 import threading
 import time
@@ -73,6 +75,112 @@ class Suite(unittest.TestCase):
         expected = (b"b", 2)
         self.assertEqual(obtained, expected)
 
+    def test_is_write(self):
+        self.assertTrue(utils.is_write("insert into t values (1);"))
+        self.assertFalse(utils.is_write("select 1"))
+        self.assertFalse(utils.is_write(
+            "insert into t values (1); delete from t"))
+
+    def test_is_local(self):
+        self.assertTrue(utils.is_local("pragma foreign_keys = on"))
+        self.assertTrue(utils.is_local("create temp table t (a)"))
+        self.assertTrue(utils.is_local("create view temp.v as select 1"))
+        self.assertTrue(utils.is_local("select 1; attach 'x.db' as x"))
+        self.assertFalse(utils.is_local("select temp from weather"))
+        self.assertFalse(utils.is_local("create table t (temp)"))
+
+    def test_hash_ring(self):
+        nodes = [("127.0.0.1", port) for port in range(1, 5)]
+        ring = utils.HashRing(nodes)
+        keys = ["/data/%d.db" % i for i in range(400)]
+        owners = {key: ring[key] for key in keys}
+        self.assertEqual(owners, {key: ring[key] for key in keys})
+        self.assertEqual(set(owners.values()), set(nodes))
+        # Removing a node only moves the keys it owned.
+        smaller = utils.HashRing(nodes[:-1])
+        for key, owner in owners.items():
+            if owner != nodes[-1]:
+                self.assertEqual(smaller[key], owner)
+
+    def test_compressed_frames(self):
+        data = pickle.dumps(["row"] * 1000)
+        for name in utils.CODECS:
+            codec = utils.Codec(name, threshold=100)
+            frame = utils.pack_frame(data, codec)
+            size, = struct.unpack("!i", frame[:4])
+            self.assertLess(size, 0)
+            self.assertEqual(utils.unpack_body(size, frame[4:], codec), data)
+            self.assertEqual(codec.stats["sent_raw"], len(data) + 4)
+            self.assertEqual(codec.stats["sent_wire"], len(frame))
+            self.assertEqual(codec.stats["received_raw"], len(data) + 4)
+        small = pickle.dumps("row")
+        frame = utils.pack_frame(small, utils.Codec(threshold=100))
+        self.assertEqual(frame, utils.pack_frame(small))
+        with self.assertRaises(sqlite3.ProgrammingError):
+            utils.Codec("snappy")
+
+
+async def echo_handler(reader, writer, client, host, port):
+    with client:
+        while True:
+            try:
+                request = await reader(client)
+            except utils.ServerBusyError as error:
+                await writer(client, utils.ServerError(error))
+                continue
+            except EOFError:
+                return
+            await writer(client, request)
+            await asyncio.sleep(0)
+
+
+class AdmissionSuite(unittest.TestCase):
+    def test_limits(self):
+        admission = utils.Admission(max_sessions=1, max_queued=1,
+                                    max_inflight_bytes=10)
+        admission.open_session()
+        with self.assertRaises(utils.ServerBusyError):
+            admission.open_session()
+        admission.reserve("a", 8)
+        with self.assertRaises(utils.ServerBusyError):
+            admission.reserve("b", 8)
+        admission.release("a")
+        admission.reserve("b", 8)
+        with admission.queue("db"):
+            with self.assertRaises(utils.ServerBusyError):
+                with admission.queue("db"):
+                    pass
+        self.assertFalse(admission.queued)
+        self.assertEqual(admission.stats["sessions"], 1)
+
+    def test_new_server_refuses_sessions(self):
+        admission = utils.Admission(max_sessions=1)
+        address = ("127.0.0.1", utils.PORT + 100)
+        loop = asyncio.new_event_loop()
+        server = loop.create_task(utils.new_server(
+            *address, echo_handler, loop, admission))
+        thread = threading.Thread(target=loop.run_forever)
+        thread.daemon = True
+        thread.start()
+        time.sleep(0.2)
+        try:
+            with utils.PickleSocket() as first, \
+                    utils.PickleSocket() as second:
+                first.settimeout(5)
+                second.settimeout(5)
+                first.connect(address)
+                first.write("ping")
+                self.assertEqual(first.read(), "ping")
+                second.connect(address)
+                second.write("ping")
+                answer = second.read()
+                self.assertIsInstance(answer.error, utils.ServerBusyError)
+        finally:
+            loop.call_soon_threadsafe(server.cancel)
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
 
 if __name__ == '__main__':
     unittest.main()